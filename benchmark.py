@@ -0,0 +1,420 @@
+"""Offline benchmark for the PDF to audio API
+
+Runs the FastAPI app in-process against a fake Gemini backend, so no API quota is used.
+Reports per-stage latency, end-to-end p50/p95/p99 and throughput under increasing
+concurrency, and peak memory, over a corpus of synthetic PDFs.
+
+    uv run python benchmark.py --concurrency 1,4,16 --pages 1,20,100 --latency 0.5
+    uv run python benchmark.py --error-rate 0.05 --json results.json
+    uv run python benchmark.py --startup-only --import-budget-ms 600
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import types as pytypes
+from typing import List, Optional
+
+SPEAKER1 = "Alex"
+SPEAKER2 = "Jordan"
+
+WORDS = (
+    "signal model layer network training data result method analysis system energy "
+    "protein market policy climate sample error theory measure design structure"
+).split()
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the PDF to audio API against a fake Gemini backend")
+    parser.add_argument("--concurrency", default="1,2,4,8,16", help="Comma-separated concurrency levels for the load test")
+    parser.add_argument("--rounds", type=int, default=4, help="Requests per concurrency level, as a multiple of the level")
+    parser.add_argument("--pages", default="1,10,50,200", help="Comma-separated page counts of the synthetic PDF corpus")
+    parser.add_argument("--words-per-page", type=int, default=400)
+    parser.add_argument("--tones", default="conversational", help="Comma-separated tones used by the load test")
+    parser.add_argument("--repeat", type=int, default=5, help="Repetitions of each per-stage measurement")
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds the fake takes to answer a text generation call")
+    parser.add_argument("--tts-first-chunk", type=float, default=0.3, help="Seconds before the fake TTS stream yields its first chunk")
+    parser.add_argument("--tts-chunk-interval", type=float, default=0.05, help="Seconds between streamed TTS chunks")
+    parser.add_argument("--tts-chunks", type=int, default=10, help="Chunks streamed per TTS call")
+    parser.add_argument("--chunk-bytes", type=int, default=9600, help="PCM bytes per streamed chunk (24 kHz 16-bit mono)")
+    parser.add_argument("--script-turns", type=int, default=24, help="Speaker turns in each fake script")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probability that a fake call fails with a retryable 503")
+    parser.add_argument("--workers", type=int, default=None, help="Override JOB_WORKERS")
+    parser.add_argument("--trace-memory", action="store_true", help="Track peak Python heap per level with tracemalloc (slower)")
+    parser.add_argument("--import-budget-ms", type=float, default=600, help="Fail when the median cold import of the app exceeds this")
+    parser.add_argument("--startup-only", action="store_true", help="Only measure cold start")
+    parser.add_argument("--json", dest="json_path", help="Also write the results to this file")
+    parser.add_argument("--verbose", action="store_true", help="Keep the app's INFO logging")
+    return parser.parse_args()
+
+# Runs in a fresh interpreter so every sample pays the full import cost
+STARTUP_PROBE = """
+import asyncio, json, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+
+async def probe():
+    async with main.app.router.lifespan_context(main.app):
+        serving = time.perf_counter()
+        await main.app.state.ready.wait()
+        return serving, time.perf_counter()
+
+serving, ready = asyncio.run(probe())
+print(json.dumps({"import": imported - start, "serving": serving - start, "ready": ready - start}))
+"""
+
+def measure_startup(args: argparse.Namespace) -> dict:
+    """Time importing the app, accepting connections and becoming ready in fresh interpreters"""
+    env = dict(os.environ)
+    env.setdefault("GEMINI_API_KEY", "benchmark")
+    samples: dict[str, List[float]] = {"import": [], "serving": [], "ready": []}
+    for _ in range(args.repeat):
+        probe = subprocess.run(
+            [sys.executable, "-c", STARTUP_PROBE], cwd=os.path.dirname(os.path.abspath(__file__)),
+            env=env, capture_output=True, text=True, check=True,
+        )
+        for name, seconds in json.loads(probe.stdout.strip().splitlines()[-1]).items():
+            samples[name].append(seconds)
+
+    results = {name: summarize(values) for name, values in samples.items()}
+    print_table("Cold start (fresh interpreter)", [
+        ("import main", results["import"]),
+        ("accepting connections", results["serving"]),
+        ("ready (/ready)", results["ready"]),
+    ])
+    median_ms = results["import"]["p50"] * 1000
+    results["import_budget_ms"] = args.import_budget_ms
+    results["within_budget"] = median_ms <= args.import_budget_ms
+    print(f"Import budget {args.import_budget_ms:.0f}ms: {'ok' if results['within_budget'] else 'EXCEEDED'} (p50 {median_ms:.0f}ms)")
+    return results
+
+def make_pdf(pages: int, words_per_page: int, seed: int = 0) -> bytes:
+    """Build a minimal text PDF with the given number of pages"""
+    rng = random.Random(seed)
+    font_id = 3 + 2 * pages
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{' '.join(f'{3 + 2 * i} 0 R' for i in range(pages))}] /Count {pages} >>",
+    ]
+    for i in range(pages):
+        text = " ".join(rng.choice(WORDS) for _ in range(words_per_page))
+        lines = [text[k:k + 90] for k in range(0, len(text), 90)]
+        body = "BT /F1 10 Tf 40 800 Td 12 TL " + " ".join(f"({line}) '" for line in lines) + " ET"
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] /Contents {4 + 2 * i} 0 R "
+            f"/Resources << /Font << /F1 {font_id} 0 R >> >> >>"
+        )
+        objects.append(f"<< /Length {len(body)} >>\nstream\n{body}\nendstream")
+    objects.append("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{obj}\nendobj\n".encode()
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return out
+
+class FakeGemini:
+    """Stand-in for genai.Client implementing the async calls the app makes"""
+
+    def __init__(self, args: argparse.Namespace):
+        from google.genai import errors, types
+        self.args = args
+        self.errors = errors
+        self.types = types
+        self.calls = 0
+        self.injected_errors = 0
+        self.script = "\n".join(
+            f"{SPEAKER1 if turn % 2 == 0 else SPEAKER2}: "
+            f"This is turn {turn} of the benchmark episode, discussing the document in a few sentences."
+            for turn in range(args.script_turns)
+        )
+        self.aio = pytypes.SimpleNamespace(models=pytypes.SimpleNamespace(
+            generate_content=self.generate_content,
+            generate_content_stream=self.generate_content_stream,
+        ))
+
+    def _maybe_fail(self):
+        self.calls += 1
+        if random.random() < self.args.error_rate:
+            self.injected_errors += 1
+            raise self.errors.ServerError(503, {"error": {"code": 503, "message": "injected", "status": "UNAVAILABLE"}})
+
+    def _response(self, part):
+        return self.types.GenerateContentResponse(candidates=[
+            self.types.Candidate(content=self.types.Content(role="model", parts=[part]))
+        ])
+
+    async def generate_content(self, model, contents, config=None):
+        await asyncio.sleep(self.args.latency)
+        self._maybe_fail()
+        return self._response(self.types.Part(text=self.script))
+
+    async def generate_content_stream(self, model, contents, config=None):
+        self._maybe_fail()
+        pcm = b"\x00\x01" * (self.args.chunk_bytes // 2)
+
+        async def stream():
+            await asyncio.sleep(self.args.tts_first_chunk)
+            for index in range(self.args.tts_chunks):
+                if index:
+                    await asyncio.sleep(self.args.tts_chunk_interval)
+                yield self._response(self.types.Part(
+                    inline_data=self.types.Blob(data=pcm, mime_type="audio/L16;codec=pcm;rate=24000")
+                ))
+        return stream()
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(q / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+def summarize(values: List[float]) -> dict:
+    return {
+        "count": len(values),
+        "mean": statistics.fmean(values) if values else None,
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else None,
+    }
+
+def format_seconds(value: Optional[float]) -> str:
+    if value is None:
+        return "-"
+    return f"{value * 1000:.1f}ms" if value < 1 else f"{value:.2f}s"
+
+def print_table(title: str, rows: List[tuple[str, dict]]):
+    print(f"\n{title}")
+    print(f"  {'':32} {'n':>5} {'mean':>10} {'p50':>10} {'p95':>10} {'p99':>10}")
+    for name, stats in rows:
+        print(
+            f"  {name:32} {stats['count']:>5} {format_seconds(stats['mean']):>10} {format_seconds(stats['p50']):>10} "
+            f"{format_seconds(stats['p95']):>10} {format_seconds(stats['p99']):>10}"
+        )
+
+async def timed(repeat: int, make_call) -> List[float]:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await make_call()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+async def benchmark_stages(main, client: FakeGemini, corpus: dict, args: argparse.Namespace) -> dict:
+    """Time the pipeline stages one at a time"""
+    results = {}
+
+    for pages, path in corpus.items():
+        results[f"extract {pages}p (prompt)"] = summarize(await timed(
+            args.repeat, lambda: asyncio.to_thread(main.extract_text_from_pdf, path, main.PROMPT_TEXT_CHARS)
+        ))
+        results[f"extract {pages}p (full)"] = summarize(await timed(
+            args.repeat, lambda: asyncio.to_thread(main.extract_text_from_pdf, path, None)
+        ))
+        full_text = main.extract_text_from_pdf(path, None)
+        results[f"passage selection {pages}p"] = summarize(await timed(
+            args.repeat, lambda: asyncio.to_thread(main.select_passages, full_text, main.PROMPT_TEXT_CHARS)
+        ))
+
+    pdf_text = main.extract_text_from_pdf(corpus[max(corpus)], main.PROMPT_TEXT_CHARS)
+    speaker1 = main.SpeakerConfig(name=SPEAKER1, voice="zephyr")
+    speaker2 = main.SpeakerConfig(name=SPEAKER2, voice="puck")
+    async def generate_script(tone: str):
+        if tone == "recursive":
+            # Research results are cached across documents, time the cold path
+            main.research_cache.entries.clear()
+            return await main.generate_recursive_explanation_script(client, pdf_text, speaker1)
+        if tone == "single_speaker":
+            return await main.generate_single_speaker_script(client, pdf_text, speaker1, tone)
+        return await main.generate_conversation_script(client, pdf_text, speaker1, speaker2, tone)
+
+    for tone in main.TONE_PRESETS:
+        results[f"script {tone}"] = summarize(await timed(args.repeat, lambda: generate_script(tone)))
+
+    segment = main.format_script_turns(main.parse_script_turns(client.script, [SPEAKER1, SPEAKER2]))
+    results["tts segment stream"] = summarize(await timed(
+        args.repeat, lambda: main.synthesize_segment(client, segment, None, 0)
+    ))
+
+    pcm = b"\x00\x01" * (args.chunk_bytes * args.tts_chunks // 2)
+    mime_type = "audio/L16;codec=pcm;rate=24000"
+
+    async def assemble():
+        path = os.path.join(tempfile.gettempdir(), f"benchmark_{os.getpid()}.wav")
+        writer = main.WavWriter(path)
+        for index in range(args.script_turns):
+            if index:
+                writer.write(main.silence_pcm(mime_type, main.TTS_SEGMENT_PADDING_MS), mime_type)
+            writer.write(pcm, mime_type)
+        writer.close()
+        os.remove(path)
+    results[f"wav assembly ({args.script_turns} segments)"] = summarize(await timed(args.repeat, assemble))
+
+    async def postprocess():
+        main.postprocess_audio(pcm, mime_type)
+    results["audio post-processing (1 segment)"] = summarize(await timed(args.repeat, postprocess))
+    return results
+
+async def run_level(main, http, corpus: dict, tones: List[str], concurrency: int, args: argparse.Namespace) -> dict:
+    """Submit concurrency * rounds jobs with at most `concurrency` in flight"""
+    files = list(corpus.values())
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    stage_samples: dict[str, List[float]] = {}
+    failures: dict[str, int] = {}
+
+    async def one(index: int):
+        path = files[index % len(files)]
+        async with semaphore:
+            start = time.perf_counter()
+            with open(path, "rb") as f:
+                response = await http.post("/jobs", files={"file": (os.path.basename(path), f.read(), "application/pdf")}, data={
+                    "speaker1_name": SPEAKER1,
+                    "speaker2_name": SPEAKER2,
+                    "tone": tones[index % len(tones)],
+                    # Also skips the segment cache, so every job pays for TTS like a new document would
+                    "bypass_cache": "true",
+                })
+            if response.status_code != 202:
+                failures[str(response.status_code)] = failures.get(str(response.status_code), 0) + 1
+                return
+            job = await main.job_manager.get(response.json()["job_id"])
+            await job.done.wait()
+            audio = await http.get(f"/jobs/{job.id}/audio")
+            if audio.status_code != 200:
+                failures[str(audio.status_code)] = failures.get(str(audio.status_code), 0) + 1
+                return
+            latencies.append(time.perf_counter() - start)
+            for stage, seconds in job.stage_timings.items():
+                stage_samples.setdefault(stage, []).append(seconds)
+
+    if args.trace_memory:
+        tracemalloc.reset_peak()
+    start = time.perf_counter()
+    await asyncio.gather(*(one(index) for index in range(concurrency * args.rounds)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "concurrency": concurrency,
+        "requests": concurrency * args.rounds,
+        "completed": len(latencies),
+        "failures": failures,
+        "elapsed_seconds": elapsed,
+        "throughput_per_second": len(latencies) / elapsed if elapsed else 0.0,
+        "latency": summarize(latencies),
+        "stages": {stage: summarize(samples) for stage, samples in stage_samples.items()},
+        "peak_heap_bytes": tracemalloc.get_traced_memory()[1] if args.trace_memory else None,
+    }
+
+async def run(args: argparse.Namespace) -> dict:
+    import httpx
+    import main
+
+    client = FakeGemini(args)
+    main.app.state.gemini_client = client
+
+    with tempfile.TemporaryDirectory(prefix="notebooklm_benchmark_") as corpus_dir:
+        corpus = {}
+        for pages in sorted(int(p) for p in args.pages.split(",")):
+            corpus[pages] = os.path.join(corpus_dir, f"synthetic_{pages}p.pdf")
+            with open(corpus[pages], "wb") as f:
+                f.write(make_pdf(pages, args.words_per_page, seed=pages))
+
+        async with main.app.router.lifespan_context(main.app):
+            await main.app.state.ready.wait()
+            print(f"Corpus: {', '.join(f'{pages} pages ({os.path.getsize(path) / 1024:.0f} KB)' for pages, path in corpus.items())}")
+            stages = await benchmark_stages(main, client, corpus, args)
+            print_table("Per-stage latency (fake Gemini)", list(stages.items()))
+
+            levels = []
+            tones = args.tones.split(",")
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as http:
+                for concurrency in (int(c) for c in args.concurrency.split(",")):
+                    level = await run_level(main, http, corpus, tones, concurrency, args)
+                    levels.append(level)
+                    heap = f", peak heap {level['peak_heap_bytes'] / 1024 / 1024:.1f} MB" if args.trace_memory else ""
+                    print(
+                        f"\nConcurrency {concurrency}: {level['completed']}/{level['requests']} completed in "
+                        f"{level['elapsed_seconds']:.2f}s, {level['throughput_per_second']:.2f} jobs/s{heap}"
+                        + (f", failures {level['failures']}" if level["failures"] else "")
+                    )
+                    print_table("  End-to-end and per-stage latency", [("end to end", level["latency"])] + [
+                        (f"  {stage}", stats) for stage, stats in level["stages"].items()
+                    ])
+
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    print(f"\nPeak RSS {peak_rss / 1024 / 1024:.1f} MB, {client.calls} fake Gemini calls, {client.injected_errors} injected errors")
+    return {
+        "config": vars(args),
+        "stages": stages,
+        "levels": levels,
+        "peak_rss_bytes": peak_rss,
+        "gemini_calls": client.calls,
+        "injected_errors": client.injected_errors,
+    }
+
+def benchmark():
+    args = parse_args()
+
+    # Configure the app before it is imported, keeping its files out of the real cache and artifact store
+    scratch = tempfile.mkdtemp(prefix="notebooklm_benchmark_state_")
+    os.environ.setdefault("RESULT_CACHE_DIR", os.path.join(scratch, "cache"))
+    os.environ.setdefault("ARTIFACT_DIR", os.path.join(scratch, "artifacts"))
+    os.environ.setdefault("SEGMENT_CACHE_DIR", os.path.join(scratch, "segments"))
+    os.environ.setdefault("STATE_DB_PATH", os.path.join(scratch, "state.sqlite3"))
+    os.environ.setdefault("GEMINI_RETRY_BASE_SECONDS", "0.05")
+    os.environ.setdefault("GEMINI_RETRY_MAX_SECONDS", "0.5")
+    if args.workers:
+        os.environ["JOB_WORKERS"] = str(args.workers)
+
+    try:
+        startup = measure_startup(args)
+        if args.startup_only:
+            results = {"config": vars(args), "startup": startup}
+        else:
+            results = run_in_process(args)
+            results["startup"] = startup
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.json_path}")
+    if not startup["within_budget"]:
+        sys.exit(1)
+
+def run_in_process(args: argparse.Namespace) -> dict:
+    if args.trace_memory:
+        tracemalloc.start()
+
+    import logging
+    import main as app_module
+    if not args.verbose:
+        app_module.logger.setLevel(logging.WARNING)
+        logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    return asyncio.run(run(args))
+
+if __name__ == "__main__":
+    benchmark()
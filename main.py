@@ -1,32 +1,367 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form
-from fastapi.responses import FileResponse
+from __future__ import annotations
+
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Request
+from fastapi.responses import FileResponse, StreamingResponse, JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Optional, List, Callable, Awaitable, AsyncIterator
+from contextlib import asynccontextmanager, contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from abc import ABC, abstractmethod
+import asyncio
+import math
 import random
-import PyPDF2
 import tempfile
 import os
 import io
+import mmap
 import base64
 import mimetypes
+import re
 import struct
-from google import genai
-from google.genai import types
-# Explicit imports to ensure availability
-from google.genai.types import MultiSpeakerVoiceConfig, SpeakerVoiceConfig
+import wave
+import httpx
 import uuid
 from dotenv import load_dotenv
 import logging
 import time
+import traceback
+import hashlib
+import json
+import shutil
+import zipfile
+import difflib
+import importlib
+import socket
+import sqlite3
+import string
+import ipaddress
+import threading
+from collections import OrderedDict, deque
+
+# Tracing is optional, spans are recorded when the OpenTelemetry API is installed and configured
+try:
+    from opentelemetry import trace
+except ImportError:
+    trace = None
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class LazyModule:
+    """Import a module on first attribute access, keeping heavy dependencies off the import path
+    
+    The lifespan warm-up loads every lazy module in the background, so requests rarely pay for it.
+    """
+    registry: List["LazyModule"] = []
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+        LazyModule.registry.append(self)
+
+    def load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    start = time.perf_counter()
+                    self._module = importlib.import_module(self._name)
+                    logger.info(f"Imported {self._name} in {(time.perf_counter() - start) * 1000:.0f}ms")
+        return self._module
+
+    def __getattr__(self, name: str):
+        return getattr(self.load(), name)
+
+    @classmethod
+    def load_all(cls):
+        for module in cls.registry:
+            module.load()
+
+genai = LazyModule("google.genai")
+types = LazyModule("google.genai.types")
+genai_errors = LazyModule("google.genai.errors")
+PyPDF2 = LazyModule("PyPDF2")
+np = LazyModule("numpy")
+
 load_dotenv()
 
-app = FastAPI(title="NotebookLM-style PDF to Audio API", description="Multi-speaker conversational PDF to audio using Gemini 2.5")
+# Job queue configuration
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "4"))
+JOB_QUEUE_SIZE = int(os.environ.get("JOB_QUEUE_SIZE", "100"))
+JOB_QUEUE_PER_CLIENT = int(os.environ.get("JOB_QUEUE_PER_CLIENT", "20"))  # 0 disables the per-client limit
+# Queued jobs plus submissions still being handled, beyond which uploads are refused unread
+JOB_ADMISSION_LIMIT = int(os.environ.get("JOB_ADMISSION_LIMIT", str(2 * JOB_QUEUE_SIZE)))
+# Proxies whose X-Client-Id and X-Forwarded-For headers are believed, as comma-separated addresses or networks
+TRUSTED_PROXIES = [
+    ipaddress.ip_network(proxy.strip(), strict=False)
+    for proxy in os.environ.get("TRUSTED_PROXIES", "").split(",") if proxy.strip()
+]
+JOB_TIMEOUT_SECONDS = float(os.environ.get("JOB_TIMEOUT_SECONDS", "600"))
+JOB_RETENTION_SECONDS = float(os.environ.get("JOB_RETENTION_SECONDS", "3600"))
+
+# Recursive mode background research configuration
+RESEARCH_TIMEOUT_SECONDS = float(os.environ.get("RESEARCH_TIMEOUT_SECONDS", "20"))
+RESEARCH_CACHE_TTL_SECONDS = float(os.environ.get("RESEARCH_CACHE_TTL_SECONDS", str(24 * 3600)))
+RESEARCH_CACHE_MAX_ENTRIES = int(os.environ.get("RESEARCH_CACHE_MAX_ENTRIES", "1000"))
+
+# Segmented TTS configuration
+TTS_SEGMENT_CHARS = int(os.environ.get("TTS_SEGMENT_CHARS", "1500"))
+TTS_FIRST_SEGMENT_CHARS = int(os.environ.get("TTS_FIRST_SEGMENT_CHARS", "300"))
+TTS_SEGMENT_CONCURRENCY = int(os.environ.get("TTS_SEGMENT_CONCURRENCY", "4"))
+TTS_SEGMENT_RETRIES = int(os.environ.get("TTS_SEGMENT_RETRIES", "2"))
+TTS_SEGMENT_PADDING_MS = int(os.environ.get("TTS_SEGMENT_PADDING_MS", "300"))
+
+# Audio post-processing configuration
+AUDIO_POSTPROCESSING = os.environ.get("AUDIO_POSTPROCESSING", "true").lower() in ("1", "true", "yes")
+AUDIO_TARGET_DBFS = float(os.environ.get("AUDIO_TARGET_DBFS", "-20"))
+AUDIO_MAX_GAIN_DB = float(os.environ.get("AUDIO_MAX_GAIN_DB", "12"))
+AUDIO_SILENCE_DBFS = float(os.environ.get("AUDIO_SILENCE_DBFS", "-50"))
+AUDIO_MAX_SILENCE_MS = int(os.environ.get("AUDIO_MAX_SILENCE_MS", "600"))
+AUDIO_BLOCK_MS = int(os.environ.get("AUDIO_BLOCK_MS", "20"))
+AUDIO_OUTPUT_SAMPLE_RATE = int(os.environ.get("AUDIO_OUTPUT_SAMPLE_RATE", "0"))  # 0 keeps the TTS rate
+
+# Long document (map-reduce) configuration
+LONG_DOCUMENT_SECTION_CHARS = int(os.environ.get("LONG_DOCUMENT_SECTION_CHARS", "12000"))
+LONG_DOCUMENT_MAX_SECTIONS = int(os.environ.get("LONG_DOCUMENT_MAX_SECTIONS", "40"))
+LONG_DOCUMENT_DIGEST_CHARS = int(os.environ.get("LONG_DOCUMENT_DIGEST_CHARS", "12000"))
+LONG_DOCUMENT_CONCURRENCY = int(os.environ.get("LONG_DOCUMENT_CONCURRENCY", "8"))
+
+# Compressed output formats, encoded with ffmpeg
+FFMPEG_BINARY = os.environ.get("FFMPEG_BINARY", "ffmpeg")
+OPUS_BITRATE = os.environ.get("OPUS_BITRATE", "48k")
+
+# Upload configuration
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_MB", "50")) * 1024 * 1024
+MAX_BATCH_UPLOAD_BYTES = int(os.environ.get("MAX_BATCH_UPLOAD_MB", "200")) * 1024 * 1024  # All PDFs of one batch
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+MAX_BATCH_JOBS = int(os.environ.get("MAX_BATCH_JOBS", "20"))  # PDFs x variants accepted by one batch
+
+# PDF extraction configuration
+PROMPT_TOKEN_BUDGET = int(os.environ.get("PROMPT_TOKEN_BUDGET", "1000"))  # Tokens of document text in script prompts
+PROMPT_TEXT_CHARS = PROMPT_TOKEN_BUDGET * 4  # At the four characters per token estimate_tokens assumes
+PASSAGE_SELECTION = os.environ.get("PASSAGE_SELECTION", "true").lower() in ("1", "true", "yes")
+PASSAGE_CHARS = int(os.environ.get("PASSAGE_CHARS", "600"))
+PDF_EXTRACT_PROCESSES = int(os.environ.get("PDF_EXTRACT_PROCESSES", str(min(4, os.cpu_count() or 1))))
+PDF_PARALLEL_MIN_PAGES = int(os.environ.get("PDF_PARALLEL_MIN_PAGES", "50"))
+pdf_process_pool: Optional[ProcessPoolExecutor] = None
+
+# Result cache configuration
+RESULT_CACHE_DIR = os.environ.get("RESULT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "notebooklm_cache"))
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_MB", "2048")) * 1024 * 1024
+RESULT_CACHE_MAX_AGE_SECONDS = float(os.environ.get("RESULT_CACHE_MAX_AGE_SECONDS", str(7 * 24 * 3600)))
+
+# Segment audio cache, reused when an edited script is synthesized again
+SEGMENT_CACHE_DIR = os.environ.get("SEGMENT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "notebooklm_segments"))
+SEGMENT_CACHE_MAX_BYTES = int(os.environ.get("SEGMENT_CACHE_MAX_MB", "2048")) * 1024 * 1024
+SEGMENT_CACHE_MAX_AGE_SECONDS = float(os.environ.get("SEGMENT_CACHE_MAX_AGE_SECONDS", str(7 * 24 * 3600)))
+
+# Shared state for running several workers or nodes: "sqlite", "memory" or "package.module:ClassName"
+STATE_BACKEND = os.environ.get("STATE_BACKEND", "sqlite")
+STATE_DB_PATH = os.environ.get("STATE_DB_PATH", os.path.join(tempfile.gettempdir(), "notebooklm_state.sqlite3"))
+STATE_POLL_SECONDS = float(os.environ.get("STATE_POLL_SECONDS", "1"))
+NODE_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+# Artifact store configuration (generated audio served for download)
+ARTIFACT_DIR = os.environ.get("ARTIFACT_DIR", os.path.join(tempfile.gettempdir(), "notebooklm_artifacts"))
+ARTIFACT_TTL_SECONDS = float(os.environ.get("ARTIFACT_TTL_SECONDS", "3600"))
+ARTIFACT_MAX_BYTES = int(os.environ.get("ARTIFACT_MAX_MB", "4096")) * 1024 * 1024
+ARTIFACT_JANITOR_INTERVAL_SECONDS = float(os.environ.get("ARTIFACT_JANITOR_INTERVAL_SECONDS", "60"))
+DOWNLOAD_CHUNK_BYTES = 256 * 1024
+
+# Shared Gemini client HTTP connection pool
+GEMINI_MAX_CONNECTIONS = int(os.environ.get("GEMINI_MAX_CONNECTIONS", "100"))
+GEMINI_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("GEMINI_MAX_KEEPALIVE_CONNECTIONS", "20"))
+GEMINI_KEEPALIVE_EXPIRY_SECONDS = float(os.environ.get("GEMINI_KEEPALIVE_EXPIRY_SECONDS", "60"))
+GEMINI_HTTP_TIMEOUT_SECONDS = float(os.environ.get("GEMINI_HTTP_TIMEOUT_SECONDS", "300"))
+
+# Gemini models
+SCRIPT_MODEL = "gemini-1.5-flash"
+TTS_MODEL = "gemini-2.5-pro-preview-tts"
+
+# Per-stage concurrency limits for Gemini calls, lowered automatically while the API returns 429s
+SCRIPT_CONCURRENCY = int(os.environ.get("SCRIPT_CONCURRENCY", "8"))
+TTS_CONCURRENCY = int(os.environ.get("TTS_CONCURRENCY", "4"))
+
+# Client-side rate limits per model (0 disables a limit) and retry policy
+SCRIPT_MODEL_RPM = float(os.environ.get("SCRIPT_MODEL_RPM", "0"))
+SCRIPT_MODEL_TPM = float(os.environ.get("SCRIPT_MODEL_TPM", "0"))
+TTS_MODEL_RPM = float(os.environ.get("TTS_MODEL_RPM", "0"))
+TTS_MODEL_TPM = float(os.environ.get("TTS_MODEL_TPM", "0"))
+GEMINI_MAX_RETRIES = int(os.environ.get("GEMINI_MAX_RETRIES", "4"))
+GEMINI_RETRY_BASE_SECONDS = float(os.environ.get("GEMINI_RETRY_BASE_SECONDS", "1"))
+GEMINI_RETRY_MAX_SECONDS = float(os.environ.get("GEMINI_RETRY_MAX_SECONDS", "30"))
+
+def create_gemini_client() -> tuple[Optional[genai.Client], Optional[httpx.AsyncClient]]:
+    """Create the application-wide Gemini client on top of a pooled HTTP transport"""
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=GEMINI_MAX_CONNECTIONS,
+            max_keepalive_connections=GEMINI_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=GEMINI_KEEPALIVE_EXPIRY_SECONDS,
+        ),
+        timeout=httpx.Timeout(GEMINI_HTTP_TIMEOUT_SECONDS, connect=10.0),
+    )
+    api_key = os.environ.get("GEMINI_API_KEY")
+    if not api_key:
+        # Keep serving /voices and /tones, conversions will report the configuration error
+        logger.error("GEMINI_API_KEY is not set, conversions will fail until it is configured")
+        return None, http_client
+    
+    client = genai.Client(
+        api_key=api_key,
+        http_options=types.HttpOptions(httpx_async_client=http_client),
+    )
+    return client, http_client
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create the shared Gemini client and start the conversion worker pool for the lifetime of the app
+    
+    Startup returns immediately so the server accepts connections while the heavy dependencies load
+    in the background; /ready reports when conversions can start, jobs submitted earlier wait queued.
+    """
+    # Tests can install their own client on app.state before startup
+    owns_client = getattr(app.state, "gemini_client", None) is None
+    http_client = None
+    app.state.ready = asyncio.Event()
+    
+    async def warm_up():
+        nonlocal http_client
+        start = time.perf_counter()
+        try:
+            await asyncio.to_thread(LazyModule.load_all)
+            if owns_client:
+                app.state.gemini_client, http_client = create_gemini_client()
+            await job_manager.start(app.state.gemini_client)
+        except Exception as e:
+            logger.error(f"Warm-up failed, the app will not become ready: {str(e)}")
+            raise
+        app.state.ready.set()
+        logger.info(f"Ready after {time.perf_counter() - start:.2f}s warm-up")
+    
+    warm_up_task = asyncio.create_task(warm_up())
+    janitor = asyncio.create_task(artifact_store.run_janitor(ARTIFACT_JANITOR_INTERVAL_SECONDS))
+    try:
+        yield
+    finally:
+        warm_up_task.cancel()
+        janitor.cancel()
+        await asyncio.gather(warm_up_task, janitor, return_exceptions=True)
+        await job_manager.stop()
+        if pdf_process_pool is not None:
+            pdf_process_pool.shutdown(cancel_futures=True)
+        if owns_client:
+            app.state.gemini_client = None
+            if http_client is not None:
+                await http_client.aclose()
+
+app = FastAPI(
+    title="NotebookLM-style PDF to Audio API",
+    description="Multi-speaker conversational PDF to audio using Gemini 2.5",
+    lifespan=lifespan,
+)
+
+def upload_limit(path: str) -> tuple[int, str]:
+    """Return the most bytes a POST to path may upload and the 413 message for exceeding it
+    
+    Batches are limited by the total size of their PDFs, each file is checked again when spooled.
+    """
+    if path == "/batch":
+        return MAX_BATCH_UPLOAD_BYTES, f"Batch exceeds the {MAX_BATCH_UPLOAD_BYTES // 1024 // 1024} MB upload limit"
+    return MAX_UPLOAD_BYTES, f"PDF exceeds the {MAX_UPLOAD_BYTES // 1024 // 1024} MB upload limit"
+
+class UploadSizeLimit:
+    """ASGI middleware rejecting oversized uploads while their body is still being received
+    
+    A too large Content-Length is refused before anything is read. Bodies without one, such as
+    chunked uploads, are counted as they arrive and cut off with a 413 once past the limit, so
+    the multipart parser never spools more than that to disk.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST":
+            await self.app(scope, receive, send)
+            return
+        max_bytes, detail = upload_limit(scope["path"])
+        # Leave room for the multipart boundaries and form fields around the files
+        limit = max_bytes + 64 * 1024
+        content_length = dict(scope["headers"]).get(b"content-length", b"")
+        if content_length.isdigit() and int(content_length) > limit:
+            logger.error(f"Rejecting {int(content_length)} byte request to {scope['path']}")
+            await JSONResponse(status_code=413, content={"detail": detail})(scope, receive, send)
+            return
+        
+        received = 0
+        async def receive_limited():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    logger.error(f"Rejecting request to {scope['path']} after {received} bytes")
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+        
+        await self.app(scope, receive_limited, send)
+
+app.add_middleware(UploadSizeLimit)
+
+# Endpoints that queue conversions, counted against JOB_ADMISSION_LIMIT before their upload is read
+ADMISSION_PATHS = ("/pdf-to-notebooklm-audio", "/jobs", "/batch")
+
+def is_trusted_proxy(host: Optional[str]) -> bool:
+    try:
+        address = ipaddress.ip_address(host or "")
+    except ValueError:
+        return False
+    return any(address in network for network in TRUSTED_PROXIES)
+
+def client_identity(request: Request) -> str:
+    """Identify the submitting client for fair queueing, by the peer address
+    
+    Behind a trusted proxy the X-Client-Id header is used, or else the nearest untrusted
+    X-Forwarded-For hop. Anyone else could pick a fresh identity per request to dodge the per-client limit.
+    """
+    host = request.client.host if request.client else None
+    if not is_trusted_proxy(host):
+        return host or "unknown"
+    client_id = request.headers.get("x-client-id", "").strip()
+    if client_id:
+        return client_id[:128]
+    for hop in reversed(request.headers.get("x-forwarded-for", "").split(",")):
+        hop = hop.strip()
+        if hop and not is_trusted_proxy(hop):
+            return hop[:128]
+    return host or "unknown"
+
+@app.middleware("http")
+async def admission_control(request: Request, call_next):
+    """Turn uploads away with a fast 503 once far more work is waiting than the job queue holds
+    
+    Below that hard limit uploads are read, because cache hits and identical in-flight
+    conversions need no queue slot. JobManager.submit applies the queue limits after that.
+    """
+    if request.method != "POST" or request.url.path not in ADMISSION_PATHS:
+        return await call_next(request)
+    if job_manager.queue.qsize() + job_manager.submitting >= JOB_ADMISSION_LIMIT:
+        logger.error(f"Admission limit of {JOB_ADMISSION_LIMIT} reached, rejecting an upload unread")
+        metrics.inc("notebooklm_errors_total", category="busy")
+        return JSONResponse(
+            status_code=503,
+            content={"detail": "Server is busy. Please try again later."},
+            headers={"Retry-After": str(job_manager.retry_after())}
+        )
+    job_manager.submitting += 1
+    try:
+        return await call_next(request)
+    finally:
+        job_manager.submitting -= 1
 
 # Add CORS middleware
 app.add_middleware(
@@ -108,88 +443,1910 @@ class AudioGenerationRequest(BaseModel):
     speaker2: Optional[SpeakerConfig] = None
     tone: Optional[str] = "conversational"
 
-@app.post("/pdf-to-notebooklm-audio")
-async def pdf_to_notebooklm_audio(
-    file: UploadFile = File(...),
-    speaker1_name: Optional[str] = Form(None),
-    speaker1_voice: Optional[str] = Form(None),
-    speaker2_name: Optional[str] = Form(None),
-    speaker2_voice: Optional[str] = Form(None),
-    tone: Optional[str] = Form("conversational")
-):
-    start_time = time.time()
-    logger.info(f"Starting PDF to audio conversion for file: {file.filename}")
+class ScriptEdit(BaseModel):
+    """An edited script in the `Speaker: text` format to synthesize again"""
+    script: str
+
+class BatchVariant(BaseModel):
+    """One tone and voice pairing requested in a batch"""
+    tone: Optional[str] = "conversational"
+    speaker1_name: Optional[str] = None
+    speaker1_voice: Optional[str] = None
+    speaker2_name: Optional[str] = None
+    speaker2_voice: Optional[str] = None
+    long_document: bool = False
+
+class Metrics:
+    """Process-wide counters and histograms rendered in the Prometheus text format
     
-    try:
-        if not file.filename.endswith('.pdf'):
-            logger.error(f"Invalid file type: {file.filename}")
-            raise HTTPException(status_code=400, detail="File must be a PDF")
+    Gauges are read from callbacks at scrape time so they never drift from the state they report.
+    """
+
+    DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+    def __init__(self):
+        # name -> (type, help text)
+        self.descriptions: dict[str, tuple[str, str]] = {}
+        self.buckets: dict[str, tuple[float, ...]] = {}
+        # name -> label tuple -> value (counters) or [bucket counts..., sum, count] (histograms)
+        self.values: dict[str, dict[tuple, object]] = {}
+        self.callbacks: dict[str, Callable[[], dict[tuple, float]]] = {}
+
+    def counter(self, name: str, help_text: str):
+        self.descriptions[name] = ("counter", help_text)
+        self.values[name] = {}
+
+    def histogram(self, name: str, help_text: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.descriptions[name] = ("histogram", help_text)
+        self.buckets[name] = buckets
+        self.values[name] = {}
+
+    def gauge(self, name: str, help_text: str, callback: Callable[[], dict[tuple, float]]):
+        """Register a gauge whose callback returns {((label, value), ...): reading}"""
+        self.descriptions[name] = ("gauge", help_text)
+        self.callbacks[name] = callback
+
+    def inc(self, name: str, amount: float = 1.0, **labels):
+        series = self.values[name]
+        key = tuple(sorted(labels.items()))
+        series[key] = series.get(key, 0.0) + amount
+
+    def observe(self, name: str, value: float, **labels):
+        buckets = self.buckets[name]
+        series = self.values[name]
+        key = tuple(sorted(labels.items()))
+        counts = series.get(key)
+        if counts is None:
+            counts = series[key] = [0] * len(buckets) + [0.0, 0]
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                counts[i] += 1
+        counts[-2] += value
+        counts[-1] += 1
+
+    @staticmethod
+    def _labels(labels: tuple, extra: tuple = ()) -> str:
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ""
+        escaped = []
+        for key, value in pairs:
+            value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+            escaped.append(f'{key}="{value}"')
+        return "{" + ",".join(escaped) + "}"
+
+    def render(self) -> str:
+        lines = []
+        for name, (metric_type, help_text) in self.descriptions.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            if metric_type == "gauge":
+                try:
+                    readings = self.callbacks[name]()
+                except Exception as e:
+                    logger.error(f"Reading gauge {name} failed: {str(e)}")
+                    continue
+                for labels, value in readings.items():
+                    lines.append(f"{name}{self._labels(labels)} {value}")
+            elif metric_type == "counter":
+                for labels, value in self.values[name].items():
+                    lines.append(f"{name}{self._labels(labels)} {value}")
+            else:
+                for labels, counts in self.values[name].items():
+                    for bound, count in zip(self.buckets[name], counts):
+                        lines.append(f"{name}_bucket{self._labels(labels, (('le', bound),))} {count}")
+                    lines.append(f"{name}_bucket{self._labels(labels, (('le', '+Inf'),))} {counts[-1]}")
+                    lines.append(f"{name}_sum{self._labels(labels)} {counts[-2]}")
+                    lines.append(f"{name}_count{self._labels(labels)} {counts[-1]}")
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+metrics.histogram("notebooklm_stage_duration_seconds", "Time spent in each pipeline stage")
+metrics.histogram("notebooklm_job_duration_seconds", "Time from job start to completion or failure")
+metrics.counter("notebooklm_jobs_total", "Finished jobs by outcome")
+metrics.counter("notebooklm_jobs_coalesced_total", "Submissions attached to an identical job already in flight")
+metrics.counter("notebooklm_cache_requests_total", "Result and segment cache lookups by cache and result")
+metrics.counter("notebooklm_gemini_retries_total", "Retried Gemini calls by model and reason")
+metrics.counter("notebooklm_errors_total", "Failed jobs and rejected submissions by error category")
+metrics.counter("notebooklm_audio_bytes_total", "Bytes of audio produced by format")
+tracer = trace.get_tracer("notebooklm-audio") if trace else None
+
+@contextmanager
+def trace_span(name: str, **attributes):
+    """Record an OpenTelemetry span when tracing is available"""
+    if tracer is None:
+        yield None
+        return
+    with tracer.start_as_current_span(
+        name, attributes={f"notebooklm.{key}": value for key, value in attributes.items() if value is not None}
+    ) as span:
+        yield span
+
+@contextmanager
+def stage_timer(stage: str, **attributes):
+    """Time a pipeline stage into the stage histogram and a trace span"""
+    start = time.perf_counter()
+    with trace_span(f"notebooklm.{stage}", **attributes):
+        try:
+            yield
+        finally:
+            metrics.observe(
+                "notebooklm_stage_duration_seconds", time.perf_counter() - start,
+                stage=stage, tone=attributes.get("tone") or ""
+            )
+
+def error_category(status_code: int) -> str:
+    return {
+        400: "bad_request",
+        408: "timeout",
+        413: "too_large",
+        429: "quota",
+        503: "busy",
+    }.get(status_code, "internal")
+
+@dataclass
+class Job:
+    """A single PDF to audio conversion tracked by the job queue"""
+    id: str
+    filename: str
+    pdf_path: Optional[str]
+    speaker1: SpeakerConfig
+    speaker2: SpeakerConfig
+    tone: str
+    long_document: bool = False
+    output_format: str = "wav"
+    pdf_bytes: int = 0
+    # Batch jobs arrive with extracted text and share digests and scripts with their siblings
+    pdf_text: Optional[str] = None
+    pdf_hash: Optional[str] = None
+    batch_id: Optional[str] = None
+    shared: Optional["SharedWork"] = None
+    # The synthesized script and how it was split, kept so edits only re-synthesize what changed
+    script: Optional[str] = None
+    segments: Optional[List[List[tuple[str, str]]]] = None
+    previous_segments: Optional[List[List[tuple[str, str]]]] = None
+    source_job_id: Optional[str] = None
+    encoded_paths: dict[str, str] = field(default_factory=dict)
+    cache_key: Optional[str] = None
+    cache_hit: bool = False
+    # Forced regeneration, which also skips the segment cache
+    bypass_cache: bool = False
+    status: str = "queued"  # queued, running, completed, failed, cancelled
+    stage: str = "queued"   # queued, waiting, extracting, summarizing, scripting, synthesizing, completed, failed, cancelled
+    progress: float = 0.0
+    error: Optional[str] = None
+    error_status: Optional[int] = None
+    result_path: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    # Seconds spent in each stage, closed when the next stage starts
+    stage_timings: dict[str, float] = field(default_factory=dict)
+    stage_started_at: float = field(default_factory=time.time)
+    done: asyncio.Event = field(default_factory=asyncio.Event)
+    # PCM written to result_path while synthesizing, tailed by streaming clients
+    audio_mime_type: Optional[str] = None
+    audio_bytes: int = 0
+    audio_event: asyncio.Event = field(default_factory=asyncio.Event)
+    # Worker that runs the job, and whether this copy was loaded from the state backend
+    node: str = NODE_ID
+    remote: bool = False
+    client_id: str = ""
+    task: Optional[asyncio.Task] = None
+    cancel_reason: Optional[str] = None
+    # Identical requests submitted while this job runs wait on it instead of converting the PDF again
+    leader: Optional["Job"] = None
+    followers: List["Job"] = field(default_factory=list)
+    coalesced_with: Optional[str] = None
+
+    def set_stage(self, stage: str, progress: float):
+        now = time.time()
+        self.stage_timings[self.stage] = self.stage_timings.get(self.stage, 0.0) + now - self.stage_started_at
+        self.stage_started_at = now
+        self.stage = stage
+        self.progress = max(self.progress, progress)
+        logger.info(f"Job {self.id}: {stage} ({self.progress:.0%})")
+        persist_job(self)
+        for follower in self.followers:
+            follower.set_stage(stage, progress)
+
+    def publish_audio(self, num_bytes: int, mime_type: str):
+        """Tell streaming clients that more PCM has been written to the result file"""
+        if self.audio_mime_type is None:
+            self.audio_mime_type = mime_type
+        self.audio_bytes += num_bytes
+        self.signal()
+
+    def signal(self):
+        """Wake up every client waiting for new audio or job completion"""
+        self.audio_event.set()
+        self.audio_event = asyncio.Event()
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "filename": self.filename,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": round(self.progress, 3),
+            "tone": self.tone,
+            "long_document": self.long_document,
+            "output_format": self.output_format,
+            "speakers": [self.speaker1.model_dump(), self.speaker2.model_dump()],
+            "error": self.error,
+            "cache_hit": self.cache_hit,
+            "batch_id": self.batch_id,
+            "source_job_id": self.source_job_id,
+            "coalesced_with": self.coalesced_with,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "stage_timings": {stage: round(seconds, 3) for stage, seconds in self.stage_timings.items()},
+            "audio_url": f"/jobs/{self.id}/audio" if self.status == "completed" else None,
+            "download_url": artifact_store.url(self.result_path) if self.status == "completed" else None,
+        }
+
+    def to_record(self) -> dict:
+        """Serializable state shared with the other workers through the state backend"""
+        return {
+            "id": self.id,
+            "filename": self.filename,
+            "speaker1": self.speaker1.model_dump(),
+            "speaker2": self.speaker2.model_dump(),
+            "tone": self.tone,
+            "long_document": self.long_document,
+            "output_format": self.output_format,
+            "pdf_bytes": self.pdf_bytes,
+            "encoded_paths": self.encoded_paths,
+            "cache_key": self.cache_key,
+            "cache_hit": self.cache_hit,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": self.progress,
+            "error": self.error,
+            "error_status": self.error_status,
+            "result_path": self.result_path,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "stage_timings": self.stage_timings,
+            "batch_id": self.batch_id,
+            "source_job_id": self.source_job_id,
+            "coalesced_with": self.coalesced_with,
+            "script": self.script,
+            "segments": self.segments,
+            "node": self.node,
+        }
+
+    @classmethod
+    def from_record(cls, record: dict) -> "Job":
+        """Rebuild a read-only copy of a job run by another worker"""
+        record = dict(record)
+        record["speaker1"] = SpeakerConfig(**record["speaker1"])
+        record["speaker2"] = SpeakerConfig(**record["speaker2"])
+        if record.get("segments") is not None:
+            record["segments"] = [[tuple(turn) for turn in segment] for segment in record["segments"]]
+        job = cls(pdf_path=None, remote=True, **record)
+        if job.finished_at is not None:
+            job.done.set()
+        return job
+
+class SharedWork:
+    """Runs each keyed piece of work once and hands the result to every job that asks for it
+    
+    Waiting jobs are shielded from each other, so one job timing out does not cancel work
+    its siblings are still waiting for. The work is cancelled once the last job waiting on it
+    leaves, and started again if another job asks for it later.
+    """
+
+    def __init__(self):
+        self.tasks: dict[tuple, asyncio.Task] = {}
+        # Number of jobs waiting on each task
+        self.waiters: dict[tuple, int] = {}
+
+    async def run(self, key: tuple, factory: Callable):
+        task = self.tasks.get(key)
+        if task is None:
+            task = self.tasks[key] = asyncio.ensure_future(factory())
+        self.waiters[key] = self.waiters.get(key, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            self.waiters[key] -= 1
+            if not self.waiters[key] and not task.done():
+                logger.info(f"Cancelling shared {key[0]} work that no job waits for any more")
+                task.cancel()
+                del self.tasks[key]
+
+class ResultCache:
+    """Content-addressed store of generated episodes with size and age bounded LRU eviction
+    
+    Each entry is a single file named after its key. The file's mtime records when it was
+    stored and its atime when it was last served, so the index survives restarts. Entries may
+    carry a JSON sidecar of metadata, stored and removed along with the file.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, max_age_seconds: float, suffix: str = ".wav"):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.suffix = suffix
+        self.hits = 0
+        self.misses = 0
+        self.total_bytes = 0
+        # key -> (size, stored_at), ordered from least to most recently used
+        self.entries: OrderedDict[str, tuple[int, float]] = OrderedDict()
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + self.suffix)
+
+    def _metadata_path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".json")
+
+    def _load(self):
+        found = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(self.suffix):
+                continue
+            stat = os.stat(os.path.join(self.directory, name))
+            found.append((stat.st_atime, name[:-len(self.suffix)], stat.st_size, stat.st_mtime))
+        for _, key, size, stored_at in sorted(found):
+            self.entries[key] = (size, stored_at)
+            self.total_bytes += size
+        self._evict()
+        logger.info(f"Result cache at {self.directory}: {len(self.entries)} entries, {self.total_bytes / 1024 / 1024:.1f} MB")
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the path of a cached entry, or None on a miss"""
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = self._adopt(key)
+        if entry is not None and time.time() - entry[1] > self.max_age_seconds:
+            self._remove(key)
+            entry = None
+        if entry is None or not os.path.exists(self._path(key)):
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
         
-        # Validate tone preset
-        if tone not in TONE_PRESETS:
-            tone = "conversational"  # fallback to default
+        self.hits += 1
+        self.entries.move_to_end(key)
+        path = self._path(key)
+        os.utime(path, (time.time(), entry[1]))
+        return path
+
+    def _adopt(self, key: str) -> Optional[tuple[int, float]]:
+        # Other workers sharing the directory may have stored the entry since the index was loaded
+        try:
+            stat = os.stat(self._path(key))
+        except FileNotFoundError:
+            return None
+        entry = self.entries[key] = (stat.st_size, stat.st_mtime)
+        self.total_bytes += stat.st_size
+        return entry
+
+    def metadata(self, key: str) -> Optional[dict]:
+        """Return the metadata stored with an entry, or None when it has none"""
+        try:
+            with open(self._metadata_path(key)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key: str, source_path: str, metadata: Optional[dict] = None):
+        """Add a file to the cache, hard linking it when possible"""
+        self._index(key, *self._store(key, source_path, metadata))
+
+    async def put_async(self, key: str, source_path: str, metadata: Optional[dict] = None):
+        """Add a file to the cache from the event loop, copying it in a thread if it cannot be linked"""
+        self._index(key, *await asyncio.to_thread(self._store, key, source_path, metadata))
+
+    def _store(self, key: str, source_path: str, metadata: Optional[dict]) -> tuple[int, float]:
+        # Only touches files, so it can run in a thread while the index is in use
+        path = self._path(key)
+        if metadata is not None:
+            # Written first, so a reader that finds the entry also finds its metadata
+            metadata_tmp_path = f"{self._metadata_path(key)}.{uuid.uuid4().hex}.tmp"
+            with open(metadata_tmp_path, "w") as f:
+                json.dump(metadata, f)
+            os.replace(metadata_tmp_path, self._metadata_path(key))
+        else:
+            remove_file(self._metadata_path(key))
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        link_or_copy(source_path, tmp_path)
+        os.replace(tmp_path, path)
         
-        # Generate default speaker configurations if not provided
-        speaker1_config, speaker2_config = generate_speaker_configs(
-            speaker1_name, speaker1_voice, speaker2_name, speaker2_voice
+        stored_at = time.time()
+        os.utime(path, (stored_at, stored_at))
+        return os.path.getsize(path), stored_at
+
+    def _index(self, key: str, size: int, stored_at: float):
+        if key in self.entries:
+            # The file itself was replaced in place
+            self.total_bytes -= self.entries.pop(key)[0]
+        self.entries[key] = (size, stored_at)
+        self.total_bytes += size
+        self._evict()
+
+    def _remove(self, key: str):
+        size, _ = self.entries.pop(key)
+        self.total_bytes -= size
+        for path in (self._path(key), self._metadata_path(key)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _evict(self):
+        cutoff = time.time() - self.max_age_seconds
+        for key in [key for key, (_, stored_at) in self.entries.items() if stored_at < cutoff]:
+            self._remove(key)
+        while self.entries and self.total_bytes > self.max_bytes:
+            self._remove(next(iter(self.entries)))
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "entries": len(self.entries),
+            "size_bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "max_age_seconds": self.max_age_seconds,
+        }
+
+class ArtifactStore:
+    """Directory of generated audio files, expired by age and bounded in total size
+    
+    An artifact's id is its file name without the extension. Every format encoded from
+    the same episode shares the id, so an episode and its encodings expire together.
+    Artifacts still being written are pinned and never removed by the janitor.
+    """
+
+    ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+    def __init__(self, directory: str, ttl_seconds: float, max_bytes: int, max_expired_ids: int = 10000):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.max_expired_ids = max_expired_ids
+        self.total_bytes = 0
+        self.removed = 0
+        # artifact id -> number of writers or readers holding it
+        self.pinned: dict[str, int] = {}
+        # Recently removed ids, so downloads can tell "expired" from "never existed"
+        self.expired: OrderedDict[str, None] = OrderedDict()
+        os.makedirs(directory, exist_ok=True)
+
+    def new_path(self, extension: str = ".wav") -> str:
+        """Allocate a path for a new artifact and pin it until the caller unpins it"""
+        path = os.path.join(self.directory, uuid.uuid4().hex + extension)
+        self.pin(path)
+        return path
+
+    @staticmethod
+    def artifact_id(path: str) -> str:
+        return os.path.splitext(os.path.basename(path))[0]
+
+    def url(self, path: Optional[str]) -> Optional[str]:
+        if not path or os.path.dirname(path) != self.directory:
+            return None
+        return f"/artifacts/{self.artifact_id(path)}"
+
+    def pin(self, path: str):
+        artifact_id = self.artifact_id(path)
+        self.pinned[artifact_id] = self.pinned.get(artifact_id, 0) + 1
+
+    def unpin(self, path: str):
+        artifact_id = self.artifact_id(path)
+        count = self.pinned.get(artifact_id, 0) - 1
+        if count > 0:
+            self.pinned[artifact_id] = count
+        else:
+            self.pinned.pop(artifact_id, None)
+
+    def find(self, artifact_id: str, extension: str) -> str:
+        """Return the path of a stored artifact, raising 404 for unknown ids and 410 for expired ones"""
+        if not self.ID_PATTERN.match(artifact_id):
+            raise HTTPException(status_code=404, detail="Artifact not found")
+        path = os.path.join(self.directory, artifact_id + extension)
+        try:
+            expired = time.time() - os.path.getmtime(path) > self.ttl_seconds and artifact_id not in self.pinned
+        except FileNotFoundError:
+            expired = None
+        if expired is None and artifact_id not in self.expired:
+            raise HTTPException(status_code=404, detail="Artifact not found")
+        if expired is not False:
+            raise HTTPException(status_code=410, detail="Audio has expired, please generate it again")
+        return path
+
+    def sweep(self, pinned: Optional[set[str]] = None) -> int:
+        """Remove expired artifacts, then the oldest ones until the store fits its quota
+        
+        Pass a snapshot of the pinned ids when sweeping from another thread.
+        """
+        if pinned is None:
+            pinned = set(self.pinned)
+        groups: dict[str, list] = {}
+        for entry in os.scandir(self.directory):
+            if not entry.is_file():
+                continue
+            stat = entry.stat()
+            group = groups.setdefault(self.artifact_id(entry.name), [0, 0.0, []])
+            group[0] += stat.st_size
+            group[1] = max(group[1], stat.st_mtime)
+            group[2].append(entry.path)
+        
+        self.total_bytes = sum(size for size, _, _ in groups.values())
+        cutoff = time.time() - self.ttl_seconds
+        removed = 0
+        for artifact_id, (size, modified_at, paths) in sorted(groups.items(), key=lambda item: item[1][1]):
+            if artifact_id in pinned:
+                continue
+            if modified_at >= cutoff and self.total_bytes <= self.max_bytes:
+                break
+            for path in paths:
+                remove_file(path)
+            self.total_bytes -= size
+            self.expired[artifact_id] = None
+            removed += 1
+        while len(self.expired) > self.max_expired_ids:
+            self.expired.popitem(last=False)
+        
+        if removed:
+            self.removed += removed
+            logger.info(f"Removed {removed} artifacts, {self.total_bytes / 1024 / 1024:.1f} MB in use")
+        return removed
+
+    async def run_janitor(self, interval_seconds: float):
+        """Sweep the store periodically for the lifetime of the app"""
+        while True:
+            try:
+                await asyncio.to_thread(self.sweep, set(self.pinned))
+            except Exception as e:
+                logger.error(f"Artifact cleanup failed: {str(e)}")
+            await asyncio.sleep(interval_seconds)
+
+    def stats(self) -> dict:
+        return {
+            "size_bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "pinned": len(self.pinned),
+            "removed": self.removed,
+        }
+
+class StateBackend(ABC):
+    """Job records and in-flight claims shared by every worker serving the app
+    
+    Subclass this for a networked store (Redis, Postgres, ...) to share state across nodes
+    and select it with STATE_BACKEND="package.module:ClassName".
+    """
+
+    @abstractmethod
+    def save_job(self, record: dict):
+        ...
+
+    @abstractmethod
+    def load_job(self, job_id: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    def delete_jobs_finished_before(self, cutoff: float):
+        ...
+
+    @abstractmethod
+    def claim(self, key: str, owner: str, ttl_seconds: float) -> Optional[str]:
+        """Claim a key for a job, returning the job already holding it or None once claimed"""
+
+    @abstractmethod
+    def release(self, key: str, owner: str):
+        ...
+
+class MemoryStateBackend(StateBackend):
+    """State kept in this process only, for a single worker"""
+
+    def __init__(self):
+        self.jobs: dict[str, dict] = {}
+        self.claims: dict[str, tuple[str, float]] = {}
+        self.lock = threading.Lock()
+
+    def save_job(self, record: dict):
+        self.jobs[record["id"]] = record
+
+    def load_job(self, job_id: str) -> Optional[dict]:
+        return self.jobs.get(job_id)
+
+    def delete_jobs_finished_before(self, cutoff: float):
+        for job_id in [job_id for job_id, record in self.jobs.items()
+                       if record["finished_at"] is not None and record["finished_at"] < cutoff]:
+            del self.jobs[job_id]
+
+    def claim(self, key: str, owner: str, ttl_seconds: float) -> Optional[str]:
+        with self.lock:
+            holder = self.claims.get(key)
+            if holder and holder[0] != owner and holder[1] > time.time():
+                return holder[0]
+            self.claims[key] = (owner, time.time() + ttl_seconds)
+            return None
+
+    def release(self, key: str, owner: str):
+        with self.lock:
+            if self.claims.get(key, (None,))[0] == owner:
+                del self.claims[key]
+
+class SQLiteStateBackend(StateBackend):
+    """State in a SQLite file, shared by the workers of a host through its file locks
+    
+    Calls may wait up to 30 seconds for another process's lock, so they are made from threads.
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.connection = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        # One connection is shared by the calling threads, so transactions must not interleave
+        self.lock = threading.Lock()
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, finished_at REAL, record TEXT NOT NULL)"
         )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS jobs_finished_at ON jobs (finished_at)")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS claims (key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        logger.info(f"Shared state in {path}")
+
+    def save_job(self, record: dict):
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO jobs (id, finished_at, record) VALUES (?, ?, ?)",
+                (record["id"], record["finished_at"], json.dumps(record)),
+            )
+
+    def load_job(self, job_id: str) -> Optional[dict]:
+        with self.lock:
+            row = self.connection.execute("SELECT record FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def delete_jobs_finished_before(self, cutoff: float):
+        with self.lock:
+            self.connection.execute("DELETE FROM jobs WHERE finished_at < ?", (cutoff,))
+
+    def claim(self, key: str, owner: str, ttl_seconds: float) -> Optional[str]:
+        with self.lock:
+            return self._claim(key, owner, ttl_seconds)
+
+    def _claim(self, key: str, owner: str, ttl_seconds: float) -> Optional[str]:
+        now = time.time()
+        # BEGIN IMMEDIATE takes the write lock, so checking and claiming is atomic across processes
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.connection.execute("SELECT owner, expires_at FROM claims WHERE key = ?", (key,)).fetchone()
+            if row and row[0] != owner and row[1] > now:
+                return row[0]
+            self.connection.execute(
+                "INSERT OR REPLACE INTO claims (key, owner, expires_at) VALUES (?, ?, ?)",
+                (key, owner, now + ttl_seconds),
+            )
+            return None
+        finally:
+            self.connection.execute("COMMIT")
+
+    def release(self, key: str, owner: str):
+        with self.lock:
+            self.connection.execute("DELETE FROM claims WHERE key = ? AND owner = ?", (key, owner))
+
+def create_state_backend(name: str) -> StateBackend:
+    if name == "sqlite":
+        return SQLiteStateBackend(STATE_DB_PATH)
+    if name == "memory":
+        return MemoryStateBackend()
+    module_name, _, class_name = name.partition(":")
+    return getattr(importlib.import_module(module_name), class_name)()
+
+class StateWriter:
+    """Makes state backend writes on a background thread, so a busy store never blocks the event loop
+    
+    Writes run in the order they were submitted. While the store is slow, only the latest
+    record of each job is kept.
+    """
+
+    def __init__(self, backend: StateBackend):
+        self.backend = backend
+        self.lock = threading.Lock()
+        self.pending: OrderedDict[str, dict] = OrderedDict()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="state-writer")
+
+    def save_job(self, record: dict):
+        with self.lock:
+            draining = bool(self.pending)
+            self.pending[record["id"]] = record
+        if not draining:
+            self.executor.submit(self._drain)
+
+    def submit(self, description: str, function: Callable, *args):
+        """Run another write after the ones already submitted, logging rather than raising failures"""
+        self.executor.submit(self._call, description, function, *args)
+
+    def _drain(self):
+        while True:
+            with self.lock:
+                if not self.pending:
+                    return
+                job_id, record = self.pending.popitem(last=False)
+            self._call(f"Saving job {job_id} to the state backend", self.backend.save_job, record)
+
+    @staticmethod
+    def _call(description: str, function: Callable, *args):
+        try:
+            function(*args)
+        except Exception as e:
+            logger.error(f"{description} failed: {str(e)}")
+
+def persist_job(job: Job):
+    """Publish a job's state to the other workers, without letting a store outage fail the job"""
+    if job.remote:
+        return
+    state_writer.save_job(job.to_record())
+
+def result_cache_key(
+    pdf_hash: str,
+    speaker1_name: Optional[str],
+    speaker1_voice: Optional[str],
+    speaker2_name: Optional[str],
+    speaker2_voice: Optional[str],
+    tone: Optional[str],
+    long_document: bool = False
+) -> str:
+    """Hash the PDF content and the normalized request parameters into a cache key"""
+    speaker1_name, speaker1_voice = normalize_speaker(speaker1_name, speaker1_voice, "zephyr")
+    speaker2_name, speaker2_voice = normalize_speaker(speaker2_name, speaker2_voice, "puck")
+    normalized = {
+        "pdf": pdf_hash,
+        "speaker1_name": speaker1_name,
+        "speaker1_voice": speaker1_voice,
+        "speaker2_name": speaker2_name,
+        "speaker2_voice": speaker2_voice,
+        "tone": tone if tone in TONE_PRESETS else "conversational",
+        "long_document": bool(long_document),
+        "audio": audio_postprocessing_settings(),
+        "prompt": {"tokens": PROMPT_TOKEN_BUDGET, "passage_selection": PASSAGE_SELECTION},
+    }
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True).encode()).hexdigest()
+
+class FairQueue:
+    """Bounded job queue served round-robin across clients, so one client's backlog cannot starve others"""
+
+    def __init__(self, maxsize: int, per_client: int):
+        self.maxsize = maxsize
+        self.per_client = per_client
+        self.clients: OrderedDict[str, deque] = OrderedDict()
+        self.size = 0
+        self.not_empty = asyncio.Event()
+
+    def qsize(self) -> int:
+        return self.size
+
+    def client_qsize(self, client_id: str) -> int:
+        return len(self.clients.get(client_id, ()))
+
+    def has_room(self, client_id: str, count: int = 1) -> bool:
+        return self.has_global_room(count) and (
+            self.per_client <= 0 or self.client_qsize(client_id) + count <= self.per_client
+        )
+
+    def has_global_room(self, count: int = 1) -> bool:
+        return self.maxsize <= 0 or self.size + count <= self.maxsize
+
+    def put_nowait(self, job: Job):
+        if not self.has_room(job.client_id):
+            raise asyncio.QueueFull
+        self.clients.setdefault(job.client_id, deque()).append(job)
+        self.size += 1
+        self.not_empty.set()
+
+    def remove(self, job: Job) -> bool:
+        jobs = self.clients.get(job.client_id)
+        if not jobs or job not in jobs:
+            return False
+        jobs.remove(job)
+        if not jobs:
+            del self.clients[job.client_id]
+        self.size -= 1
+        return True
+
+    async def get(self) -> Job:
+        while not self.size:
+            self.not_empty.clear()
+            await self.not_empty.wait()
+        # Take the oldest job of the client at the front, then send that client to the back
+        client_id, jobs = next(iter(self.clients.items()))
+        job = jobs.popleft()
+        if jobs:
+            self.clients.move_to_end(client_id)
+        else:
+            del self.clients[client_id]
+        self.size -= 1
+        return job
+
+class JobManager:
+    """In-process job queue served by a fixed-size pool of worker tasks"""
+
+    def __init__(self, num_workers: int, queue_size: int, queue_per_client: int = 0):
+        self.num_workers = num_workers
+        self.jobs: dict[str, Job] = {}
+        self.queue = FairQueue(queue_size, queue_per_client)
+        self.workers: List[asyncio.Task] = []
+        self.client: Optional[genai.Client] = None
+        # Queued or running job for each cache key, joined by identical submissions
+        self.in_flight: dict[str, Job] = {}
+        # Requests to the submission endpoints being handled, counted by the admission middleware
+        self.submitting = 0
+        # Moving average of job run time, used to tell rejected clients when to come back
+        self.average_job_seconds = 60.0
+
+    async def start(self, client: Optional[genai.Client]):
+        logger.info(f"Starting {self.num_workers} conversion workers")
+        self.client = client
+        self.workers = [
+            asyncio.create_task(self._worker(n)) for n in range(self.num_workers)
+        ]
+
+    async def stop(self):
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+    async def submit(self, job: Job) -> Job:
+        self._prune()
+        if job.cache_key:
+            cached_path = result_cache.get(job.cache_key)
+            metrics.inc("notebooklm_cache_requests_total", cache="result", result="hit" if cached_path else "miss")
+            if cached_path and await self._complete_from_cache(job, cached_path):
+                logger.info(f"Served job {job.id} from the result cache")
+                metrics.inc("notebooklm_jobs_total", status="cached")
+                persist_job(job)
+                return job
+            leader = self.in_flight.get(job.cache_key)
+            if leader is not None:
+                self._follow(job, leader)
+                return job
+        self.admit(job.client_id)
+        self.queue.put_nowait(job)
+        self.jobs[job.id] = job
+        if job.cache_key:
+            self.in_flight[job.cache_key] = job
+        persist_job(job)
+        logger.info(f"Queued job {job.id} ({self.queue.qsize()} waiting)")
+        return job
+
+    def _follow(self, job: Job, leader: Job):
+        """Attach a job to an identical one already queued or running, to share its result"""
+        remove_file(job.pdf_path)
+        job.pdf_path = None
+        job.pdf_text = None
+        job.shared = None
+        job.leader = leader
+        job.coalesced_with = leader.id
+        # Default speaker names are drawn per request, report the ones the shared episode uses
+        job.speaker1 = leader.speaker1
+        job.speaker2 = leader.speaker2
+        job.status = leader.status
+        job.stage = leader.stage
+        job.progress = leader.progress
+        job.started_at = leader.started_at
+        leader.followers.append(job)
+        self.jobs[job.id] = job
+        metrics.inc("notebooklm_jobs_coalesced_total")
+        persist_job(job)
+        logger.info(f"Job {job.id} joins identical job {leader.id} ({len(leader.followers)} waiting on it)")
+
+    def _unfollow(self, job: Job, reason: str):
+        """Detach a cancelled follower, stopping its leader when nobody wants the result any more"""
+        leader = job.leader
+        leader.followers.remove(job)
+        job.leader = None
+        job.cancel_reason = reason
+        logger.info(f"Job {job.id} stops waiting for identical job {leader.id}: {reason}")
+        self._cancelled(job)
+        self._finish(job)
+        # Wake the follower's streams, which wait on the leader
+        leader.signal()
+        if leader.cancel_reason is not None and not leader.followers:
+            self._stop(leader)
+
+    def _release_followers(self, job: Job):
+        """Hand a finished job's outcome to every identical job that waited on it"""
+        if job.cache_key and self.in_flight.get(job.cache_key) is job:
+            del self.in_flight[job.cache_key]
+        followers, job.followers = job.followers, []
+        for follower in followers:
+            follower.leader = None
+            if job.status == "completed":
+                # _share_result already gave it its own link to the episode
+                follower.script = job.script
+                follower.segments = job.segments
+                follower.status = "completed"
+                follower.stage = "completed"
+                follower.progress = 1.0
+            elif job.status in ("failed", "cancelled"):
+                follower.status = job.status
+                follower.stage = job.stage
+                follower.error = job.error
+                follower.error_status = job.error_status
+            else:
+                # The worker is shutting down
+                follower.cancel_reason = "server shutting down"
+                self._cancelled(follower)
+            self._finish(follower)
+
+    async def _share_result(self, job: Job):
+        """Give every job waiting on a finished one its own link to the episode, so the source can expire independently"""
+        if job.cache_key and self.in_flight.get(job.cache_key) is job:
+            # Identical requests are served by the result cache from now on
+            del self.in_flight[job.cache_key]
+        followers = list(job.followers)
+        paths = [artifact_store.new_path(".wav") for _ in followers]
         
-        logger.info(f"Using speakers: {speaker1_config.name} ({speaker1_config.voice}) and {speaker2_config.name} ({speaker2_config.voice})")
-        logger.info(f"Using tone preset: {tone}")
+        def link_all():
+            for path in paths:
+                link_or_copy(job.result_path, path)
         
-        # Read PDF content
-        logger.info("Reading PDF content...")
-        pdf_content = await file.read()
-        pdf_size = len(pdf_content) / 1024 / 1024  # MB
-        logger.info(f"PDF size: {pdf_size:.1f} MB")
+        try:
+            await asyncio.to_thread(link_all)
+        except BaseException:
+            for path in paths:
+                remove_file(path)
+            raise
+        finally:
+            for path in paths:
+                artifact_store.unpin(path)
+        for follower, path in zip(followers, paths):
+            if follower.leader is job:
+                follower.result_path = path
+            else:
+                # It stopped waiting while the links were made
+                remove_file(path)
+
+    async def _complete_from_cache(self, job: Job, cached_path: str) -> bool:
+        """Complete a job with a copy of a cached episode, returning False if the entry went away"""
+        # Copy the entry so eviction cannot remove the file while the job still serves it. A link
+        # would share the entry's mtime, which the artifact store reads as the artifact's age.
+        result_path = artifact_store.new_path(".wav")
         
-        pdf_text = extract_text_from_pdf(pdf_content)
+        def copy_entry() -> Optional[dict]:
+            shutil.copyfile(cached_path, result_path)
+            return result_cache.metadata(job.cache_key)
+        
+        try:
+            metadata = await asyncio.to_thread(copy_entry)
+        except OSError as e:
+            logger.warning(f"Could not serve job {job.id} from the result cache: {str(e)}")
+            remove_file(result_path)
+            return False
+        finally:
+            artifact_store.unpin(result_path)
+        job.result_path = result_path
+        remove_file(job.pdf_path)
+        job.pdf_path = None
+        if metadata:
+            # Default speaker names are drawn per request, report the ones the cached episode uses
+            job.speaker1 = SpeakerConfig(**metadata["speaker1"])
+            job.speaker2 = SpeakerConfig(**metadata["speaker2"])
+            job.script = metadata["script"]
+            if metadata["segments"] is not None:
+                job.segments = [[tuple(turn) for turn in segment] for segment in metadata["segments"]]
+        job.status = "completed"
+        job.stage = "completed"
+        job.progress = 1.0
+        job.cache_hit = True
+        job.started_at = job.finished_at = time.time()
+        job.done.set()
+        self.jobs[job.id] = job
+        return True
+
+    def admit(self, client_id: str, num_jobs: int = 1):
+        """Raise a 503 with Retry-After when the queue, or this client's share of it, has no room"""
+        if self.queue.has_room(client_id, num_jobs):
+            return
+        logger.error(f"Job queue full, rejecting {num_jobs} job(s) from {client_id}")
+        metrics.inc("notebooklm_errors_total", category="busy")
+        if self.queue.has_global_room(num_jobs):
+            detail = f"Too many queued conversions for this client (limit {self.queue.per_client}). Please try again later."
+        else:
+            detail = "Server is busy. Please try again later."
+        raise HTTPException(status_code=503, detail=detail, headers={"Retry-After": str(self.retry_after())})
+
+    def retry_after(self) -> int:
+        """Seconds until a running job is expected to finish and free a queue slot"""
+        return max(1, min(math.ceil(self.average_job_seconds / max(1, self.num_workers)), int(JOB_TIMEOUT_SECONDS)))
+
+    async def get(self, job_id: str) -> Job:
+        job = self.jobs.get(job_id)
+        if job is None:
+            # The job may have been submitted to another worker
+            record = await asyncio.to_thread(state_backend.load_job, job_id)
+            if record is None:
+                raise HTTPException(status_code=404, detail="Job not found")
+            job = Job.from_record(record)
+        return job
+
+    def _prune(self):
+        """Forget finished jobs older than the retention window"""
+        cutoff = time.time() - JOB_RETENTION_SECONDS
+        expired = [
+            job_id for job_id, job in self.jobs.items()
+            if job.finished_at is not None and job.finished_at < cutoff
+        ]
+        for job_id in expired:
+            del self.jobs[job_id]
+        state_writer.submit("Pruning the state backend", state_backend.delete_jobs_finished_before, cutoff)
+
+    async def _worker(self, worker_id: int):
+        while True:
+            job = await self.queue.get()
+            # A task per job lets cancel() stop it without stopping the worker
+            task = job.task = asyncio.create_task(self._run(job))
+            try:
+                await asyncio.wait({task})
+            except asyncio.CancelledError:
+                # The worker itself is shutting down
+                task.cancel()
+                raise
+            if not job.done.is_set():
+                # Cancelled before _run took its first step, so nothing else will finish it
+                logger.info(f"Cancelled job {job.id} before it started: {job.cancel_reason}")
+                self._release_followers(job)
+                self._cancelled(job)
+                self._finish(job)
+
+    async def _wait_for_duplicate(self, job: Job) -> bool:
+        """Claim the job's cache key, waiting while another job anywhere runs the same conversion
+        
+        Returns True when the job was completed from the other job's cached result.
+        """
+        while True:
+            try:
+                owner = await asyncio.to_thread(state_backend.claim, job.cache_key, job.id, JOB_TIMEOUT_SECONDS + 60)
+            except Exception as e:
+                # A store outage should not fail the job, at worst another worker converts the same PDF
+                logger.error(f"Claiming job {job.id} in the state backend failed: {str(e)}")
+                return False
+            if owner is None:
+                return False
+            if job.stage != "waiting":
+                logger.info(f"Job {job.id} waits for identical job {owner}")
+                job.set_stage("waiting", job.progress)
+            await asyncio.sleep(STATE_POLL_SECONDS)
+            cached_path = result_cache.get(job.cache_key)
+            if cached_path and await self._complete_from_cache(job, cached_path):
+                logger.info(f"Served job {job.id} from the result of job {owner}")
+                return True
+
+    def cancel(self, job: Job, reason: str) -> bool:
+        """Stop a queued or running job, its Gemini calls and its partial audio
+        
+        The job timeout uses the same path. A job that identical jobs are waiting on keeps
+        running for them until the last one leaves, unless it times out. Returns False when
+        the job has already finished or been cancelled.
+        """
+        if job.done.is_set() or job.remote:
+            return False
+        if job.leader is not None:
+            self._unfollow(job, reason)
+            return True
+        if job.cancel_reason is not None and (reason != "timeout" or not job.followers):
+            return False
+        if job.followers and reason != "timeout":
+            job.cancel_reason = reason
+            logger.info(f"Job {job.id} released ({reason}), still running for {len(job.followers)} identical job(s)")
+            return True
+        job.cancel_reason = reason
+        self._stop(job)
+        return True
+
+    def _stop(self, job: Job):
+        if job.cache_key and self.in_flight.get(job.cache_key) is job:
+            del self.in_flight[job.cache_key]
+        if self.queue.remove(job):
+            logger.info(f"Cancelled queued job {job.id}: {job.cancel_reason}")
+            self._cancelled(job)
+            self._finish(job)
+        elif job.task is not None:
+            job.task.cancel()
+
+    async def _run(self, job: Job):
+        job.status = "running"
+        job.started_at = time.time()
+        persist_job(job)
+        for follower in job.followers:
+            follower.status = job.status
+            follower.started_at = job.started_at
+        metrics.observe("notebooklm_stage_duration_seconds", job.started_at - job.created_at, stage="queued", tone=job.tone)
+        timeout = asyncio.get_running_loop().call_later(JOB_TIMEOUT_SECONDS, self.cancel, job, "timeout")
+        claimed = False
+        try:
+            if job.cache_key:
+                if await self._wait_for_duplicate(job):
+                    await self._share_result(job)
+                    return
+                claimed = True
+            with trace_span("notebooklm.job", job_id=job.id, tone=job.tone, pdf_bytes=job.pdf_bytes,
+                            long_document=job.long_document, output_format=job.output_format):
+                job.result_path = await run_conversion_job(job, self.client)
+            job.status = "completed"
+            job.set_stage("completed", 1.0)
+            if job.cache_key:
+                await result_cache.put_async(job.cache_key, job.result_path, {
+                    "speaker1": job.speaker1.model_dump(),
+                    "speaker2": job.speaker2.model_dump(),
+                    "script": job.script,
+                    "segments": job.segments,
+                })
+            await self._share_result(job)
+            metrics.inc("notebooklm_audio_bytes_total", os.path.getsize(job.result_path), format="wav")
+            for output_format, path in job.encoded_paths.items():
+                metrics.inc("notebooklm_audio_bytes_total", os.path.getsize(path), format=output_format)
+            logger.info(f"Job {job.id} completed in {time.time() - job.started_at:.1f} seconds")
+        except asyncio.CancelledError:
+            if job.cancel_reason is None:
+                # The worker itself is shutting down
+                raise
+            if job.cancel_reason == "timeout":
+                logger.error(f"Job {job.id} timed out after {JOB_TIMEOUT_SECONDS:.0f} seconds")
+                self._fail(job, HTTPException(status_code=408, detail="Audio generation timed out. Please try with a smaller PDF."))
+            else:
+                logger.info(f"Cancelled job {job.id} after {time.time() - job.started_at:.1f}s: {job.cancel_reason}")
+                self._cancelled(job)
+        except Exception as e:
+            logger.error(f"Job {job.id} failed after {time.time() - job.started_at:.1f}s: {str(e)}")
+            logger.error(f"Traceback: {traceback.format_exc()}")
+            self._fail(job, error_to_http_exception(e))
+        finally:
+            timeout.cancel()
+            if claimed:
+                state_writer.submit(f"Releasing the claim of job {job.id}", state_backend.release, job.cache_key, job.id)
+            self._release_followers(job)
+            if job.status == "completed" and job.cancel_reason:
+                # Its own client left while identical jobs waited, they now hold their own copies
+                for path in (job.result_path, *job.encoded_paths.values()):
+                    remove_file(path)
+                job.result_path = None
+                job.encoded_paths = {}
+                self._cancelled(job)
+            self._finish(job)
+            if not job.cache_hit:
+                self.average_job_seconds += 0.2 * (job.finished_at - job.started_at - self.average_job_seconds)
+
+    def _finish(self, job: Job):
+        """Release a finished job's inputs, record it and wake everyone waiting on it"""
+        remove_file(job.pdf_path)
+        job.pdf_path = None
+        job.pdf_text = None
+        job.shared = None
+        job.previous_segments = None
+        job.task = None
+        job.finished_at = time.time()
+        metrics.inc("notebooklm_jobs_total", status="cached" if job.cache_hit else job.status)
+        if job.started_at is not None:
+            metrics.observe("notebooklm_job_duration_seconds", job.finished_at - job.started_at, status=job.status)
+        persist_job(job)
+        job.done.set()
+        job.signal()
+
+    def _fail(self, job: Job, error: HTTPException):
+        job.status = "failed"
+        job.stage = "failed"
+        job.error = error.detail
+        job.error_status = error.status_code
+        metrics.inc("notebooklm_errors_total", category=error_category(error.status_code))
+
+    def _cancelled(self, job: Job):
+        job.status = "cancelled"
+        job.stage = "cancelled"
+        job.error = f"Job was cancelled: {job.cancel_reason}"
+        job.error_status = 409
+
+state_backend = create_state_backend(STATE_BACKEND)
+state_writer = StateWriter(state_backend)
+result_cache = ResultCache(RESULT_CACHE_DIR, RESULT_CACHE_MAX_BYTES, RESULT_CACHE_MAX_AGE_SECONDS)
+segment_cache = ResultCache(SEGMENT_CACHE_DIR, SEGMENT_CACHE_MAX_BYTES, SEGMENT_CACHE_MAX_AGE_SECONDS)
+artifact_store = ArtifactStore(ARTIFACT_DIR, ARTIFACT_TTL_SECONDS, ARTIFACT_MAX_BYTES)
+job_manager = JobManager(JOB_WORKERS, JOB_QUEUE_SIZE, JOB_QUEUE_PER_CLIENT)
+
+metrics.gauge(
+    "notebooklm_jobs_in_flight", "Jobs currently running, not counting jobs coalesced onto another",
+    lambda: {(): sum(1 for job in job_manager.jobs.values() if job.status == "running" and job.leader is None)}
+)
+metrics.gauge("notebooklm_jobs_queued", "Jobs waiting for a worker", lambda: {(): job_manager.queue.qsize()})
+metrics.gauge("notebooklm_result_cache_bytes", "Disk used by the result cache", lambda: {(): result_cache.total_bytes})
+metrics.gauge("notebooklm_artifact_bytes", "Disk used by downloadable artifacts at the last sweep", lambda: {(): artifact_store.total_bytes})
+
+async def create_job(
+    file: UploadFile,
+    speaker1_name: Optional[str],
+    speaker1_voice: Optional[str],
+    speaker2_name: Optional[str],
+    speaker2_voice: Optional[str],
+    tone: Optional[str],
+    bypass_cache: bool = False,
+    long_document: bool = False,
+    output_format: str = "wav",
+    client_id: str = ""
+) -> Job:
+    """Validate an upload and submit it to the job queue"""
+    if not file.filename.endswith('.pdf'):
+        logger.error(f"Invalid file type: {file.filename}")
+        raise HTTPException(status_code=400, detail="File must be a PDF")
+    
+    # Validate tone preset
+    if tone not in TONE_PRESETS:
+        tone = "conversational"  # fallback to default
+    
+    # Generate default speaker configurations if not provided
+    speaker1_config, speaker2_config = generate_speaker_configs(
+        speaker1_name, speaker1_voice, speaker2_name, speaker2_voice
+    )
+    
+    logger.info(f"Using speakers: {speaker1_config.name} ({speaker1_config.voice}) and {speaker2_config.name} ({speaker2_config.voice})")
+    logger.info(f"Using tone preset: {tone}")
+    
+    # Spool PDF content to disk
+    logger.info("Reading PDF content...")
+    pdf_path, pdf_hash, pdf_bytes = await spool_upload(file, MAX_UPLOAD_BYTES)
+    pdf_size = pdf_bytes / 1024 / 1024  # MB
+    logger.info(f"PDF size: {pdf_size:.1f} MB")
+    
+    cache_key = None
+    if not bypass_cache:
+        cache_key = result_cache_key(
+            pdf_hash,
+            speaker1_name, speaker1_voice, speaker2_name, speaker2_voice, tone, long_document
+        )
+    
+    job = Job(
+        id=str(uuid.uuid4()),
+        filename=file.filename,
+        pdf_path=pdf_path,
+        speaker1=speaker1_config,
+        speaker2=speaker2_config,
+        tone=tone,
+        long_document=long_document,
+        output_format=output_format,
+        pdf_bytes=pdf_bytes,
+        cache_key=cache_key,
+        bypass_cache=bypass_cache,
+        client_id=client_id,
+    )
+    try:
+        return await job_manager.submit(job)
+    except HTTPException:
+        remove_file(pdf_path)
+        raise
+
+def parse_batch_variants(variants: str) -> List[BatchVariant]:
+    """Parse the JSON list of variants sent with a batch"""
+    try:
+        items = json.loads(variants)
+        if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+            raise ValueError("expected a JSON list of objects")
+        return [BatchVariant(**item) for item in items]
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid variants: {str(e)[:200]}")
+
+async def create_batch_jobs(
+    files: List[UploadFile],
+    variants: List[BatchVariant],
+    bypass_cache: bool = False,
+    output_format: str = "wav",
+    client_id: str = ""
+) -> List[Job]:
+    """Extract each PDF once and submit a job per PDF and variant, sharing scripts between them"""
+    if not files or not variants:
+        raise HTTPException(status_code=400, detail="A batch needs at least one PDF and one variant")
+    num_jobs = len(files) * len(variants)
+    if num_jobs > MAX_BATCH_JOBS:
+        raise HTTPException(status_code=400, detail=f"A batch can produce at most {MAX_BATCH_JOBS} episodes, got {num_jobs}")
+    for file in files:
+        if not file.filename.endswith('.pdf'):
+            logger.error(f"Invalid file type: {file.filename}")
+            raise HTTPException(status_code=400, detail="File must be a PDF")
+    job_manager.admit(client_id, num_jobs)
+    
+    batch_id = str(uuid.uuid4())
+    logger.info(f"Batch {batch_id}: {len(files)} PDFs x {len(variants)} variants")
+    
+    # Passage selection and long document variants need the whole text, otherwise only the start is read
+    needs_whole_text = PASSAGE_SELECTION or any(variant.long_document for variant in variants)
+    max_chars = None if needs_whole_text else PROMPT_TEXT_CHARS
+    sources = []
+    for file in files:
+        pdf_path, pdf_hash, pdf_bytes = await spool_upload(file, MAX_UPLOAD_BYTES)
+        try:
+            with stage_timer("extraction", batch_id=batch_id, pdf_bytes=pdf_bytes):
+                pdf_text = await extract_pdf_text(pdf_path, max_chars=max_chars)
+        except Exception as e:
+            logger.error(f"Extracting {file.filename} failed: {str(e)}")
+            raise error_to_http_exception(e)
+        finally:
+            remove_file(pdf_path)
+        if not pdf_text.strip():
+            logger.error(f"No text found in {file.filename}")
+            raise HTTPException(status_code=400, detail=f"No text found in {file.filename}")
+        sources.append((file.filename, pdf_hash, pdf_bytes, pdf_text))
+    
+    shared = SharedWork()
+    jobs = []
+    for filename, pdf_hash, pdf_bytes, pdf_text in sources:
+        for variant in variants:
+            tone = variant.tone if variant.tone in TONE_PRESETS else "conversational"
+            speaker1_config, speaker2_config = generate_speaker_configs(
+                variant.speaker1_name, variant.speaker1_voice, variant.speaker2_name, variant.speaker2_voice
+            )
+            cache_key = None
+            if not bypass_cache:
+                cache_key = result_cache_key(
+                    pdf_hash,
+                    variant.speaker1_name, variant.speaker1_voice, variant.speaker2_name, variant.speaker2_voice,
+                    tone, variant.long_document
+                )
+            job = Job(
+                id=str(uuid.uuid4()),
+                filename=filename,
+                pdf_path=None,
+                speaker1=speaker1_config,
+                speaker2=speaker2_config,
+                tone=tone,
+                long_document=variant.long_document,
+                output_format=output_format,
+                pdf_bytes=pdf_bytes,
+                pdf_text=pdf_text,
+                pdf_hash=pdf_hash,
+                batch_id=batch_id,
+                shared=shared,
+                cache_key=cache_key,
+                bypass_cache=bypass_cache,
+                client_id=client_id,
+            )
+            jobs.append(await job_manager.submit(job))
+    return jobs
+
+async def build_batch_archive(jobs: List[Job], output_format: str) -> str:
+    """Zip the audio of a finished batch with a manifest listing every variant"""
+    _, extension, _, _ = OUTPUT_FORMATS[output_format]
+    entries = []
+    manifest = []
+    for index, job in enumerate(jobs, start=1):
+        item = job.to_dict()
+        if job.status == "completed":
+            name = f"{index:02d}_{os.path.splitext(job.filename)[0]}_{job.tone}_{job.speaker1.name}_{job.speaker2.name}"
+            name = re.sub(r"[^A-Za-z0-9_.-]+", "_", name) + extension
+            entries.append((name, await job_audio_path(job, output_format)))
+            item["file"] = name
+        manifest.append(item)
+    
+    archive_path = artifact_store.new_path(".zip")
+    
+    def write_archive():
+        # Audio barely compresses, so store it as is
+        with zipfile.ZipFile(archive_path, "w", zipfile.ZIP_STORED) as archive:
+            for name, path in entries:
+                archive.write(path, name)
+            archive.writestr("manifest.json", json.dumps(manifest, indent=2))
+    
+    try:
+        await asyncio.to_thread(write_archive)
+    except BaseException:
+        remove_file(archive_path)
+        raise
+    finally:
+        artifact_store.unpin(archive_path)
+    return archive_path
+
+async def spool_upload(file: UploadFile, max_bytes: int) -> tuple[str, str, int]:
+    """Copy an upload to a temp file in chunks, hashing it and enforcing the size limit
+    
+    Returns the spooled file path, the SHA-256 of its content and its size in bytes.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    spool = tempfile.NamedTemporaryFile(prefix="notebooklm_upload_", suffix=".pdf", delete=False)
+    try:
+        with spool:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    logger.error(f"Upload {file.filename} exceeds {max_bytes / 1024 / 1024:.0f} MB")
+                    raise HTTPException(status_code=413, detail=f"PDF exceeds the {max_bytes // 1024 // 1024} MB upload limit")
+                digest.update(chunk)
+                spool.write(chunk)
+        if size == 0:
+            raise HTTPException(status_code=400, detail="Uploaded file is empty")
+    except BaseException:
+        remove_file(spool.name)
+        raise
+    return spool.name, digest.hexdigest(), size
+
+def remove_file(file_path: Optional[str]):
+    if file_path and os.path.exists(file_path):
+        os.remove(file_path)
+
+def link_or_copy(source_path: str, path: str):
+    """Hard link a file, copying it where links are not supported"""
+    try:
+        os.link(source_path, path)
+    except OSError:
+        shutil.copyfile(source_path, path)
+
+async def run_conversion_job(job: Job, client: Optional[genai.Client]) -> str:
+    """Run the full conversion pipeline for a queued job"""
+    if client is None:
+        raise HTTPException(status_code=500, detail="API key configuration error")
+    
+    if job.script is not None:
+        # Edited scripts go straight to synthesis
+        pdf_text = ""
+    elif job.pdf_text is not None:
+        # Batches extract each PDF once before submitting their jobs
+        pdf_text = job.pdf_text
+    else:
+        job.set_stage("extracting", 0.05)
+        # Passage selection and long document mode read the whole text. Without either, script
+        # prompts only read the start of the document, so stop parsing once it is covered.
+        max_chars = None if job.long_document or PASSAGE_SELECTION else PROMPT_TEXT_CHARS
+        with stage_timer("extraction", job_id=job.id, pdf_bytes=job.pdf_bytes):
+            pdf_text = await extract_pdf_text(job.pdf_path, max_chars=max_chars)
         text_length = len(pdf_text)
         logger.info(f"Extracted {text_length} characters from PDF")
         
         if not pdf_text.strip():
             logger.error("No text found in PDF")
             raise HTTPException(status_code=400, detail="No text found in PDF")
-        
-        # Generate conversational audio using Gemini 2.5 TTS
-        logger.info("Starting conversational audio generation...")
-        import asyncio
-        
-        # Add timeout to prevent hanging (10 minutes max)
+    
+    # Generate conversational audio using Gemini 2.5 TTS
+    logger.info("Starting conversational audio generation...")
+    return await generate_conversational_audio(
+        client, pdf_text, job.speaker1, job.speaker2, job.tone, job=job, long_document=job.long_document
+    )
+
+def error_to_http_exception(e: Exception) -> HTTPException:
+    """Map a pipeline error to the HTTP error reported to the client"""
+    if isinstance(e, HTTPException):
+        return e
+    logger.error(f"Error type: {type(e).__name__}")
+    
+    # Return a more specific error message
+    if "GEMINI_API_KEY" in str(e) or "api_key" in str(e):
+        return HTTPException(status_code=500, detail="API key configuration error")
+    elif is_rate_limit_error(e) or "quota" in str(e).lower() or "limit" in str(e).lower():
+        return HTTPException(status_code=429, detail="API quota exceeded. Please try again later.")
+    elif "timeout" in str(e).lower() or "deadline" in str(e).lower():
+        return HTTPException(status_code=408, detail="Request timeout. Please try with a smaller PDF.")
+    else:
+        return HTTPException(status_code=500, detail=f"Internal server error: {str(e)[:100]}")
+
+async def wait_for_first_audio(job: Job):
+    """Wait until a job has produced audio or finished"""
+    # Jobs coalesced into an identical one play its audio
+    source = job.leader or job
+    while not source.audio_bytes and not source.done.is_set() and not job.done.is_set():
+        await source.audio_event.wait()
+    if job.status in ("failed", "cancelled"):
+        raise HTTPException(status_code=job.error_status or 500, detail=job.error)
+
+async def wait_for_disconnect(request: Request):
+    """Return once the client has closed the connection, after the request body has been read"""
+    # Request.is_disconnected cannot see the disconnect through the HTTP middlewares, receive can
+    while (await request.receive())["type"] != "http.disconnect":
+        pass
+
+async def wait_or_cancel(request: Request, jobs: List[Job], waiter: Awaitable):
+    """Await `waiter` on behalf of jobs the request owns, cancelling them if the client goes away first"""
+    task = asyncio.ensure_future(waiter)
+    disconnect = asyncio.ensure_future(wait_for_disconnect(request))
+    try:
+        await asyncio.wait({task, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+        if task.done():
+            return task.result()
+        logger.info(f"Client disconnected, cancelling {len(jobs)} job(s)")
+        for job in jobs:
+            job_manager.cancel(job, "client disconnected")
+        raise HTTPException(status_code=499, detail="Client disconnected")
+    except asyncio.CancelledError:
+        for job in jobs:
+            job_manager.cancel(job, "request cancelled")
+        raise
+    finally:
+        task.cancel()
+        disconnect.cancel()
+        # A cancelled gather() finishes with a CancelledError exception, which is logged unless retrieved
+        task.add_done_callback(lambda done: done.cancelled() or done.exception())
+
+async def cancel_when_abandoned(job: Job, stream: AsyncIterator[bytes]):
+    """Pass a request-owned job's audio stream through, cancelling the job if the client stops reading"""
+    try:
+        async for data in stream:
+            yield data
+    finally:
+        job_manager.cancel(job, "client disconnected")
+
+async def tail_job_pcm(job: Job, block_size: int = 64 * 1024):
+    """Yield PCM from the job's WAV file as it grows, until the job finishes"""
+    # Keep our own handle so the data stays readable if a failed job deletes the file
+    with open(job.result_path, "rb") as f:
+        f.seek(WAV_HEADER_SIZE)
+        sent = 0
+        while True:
+            while sent < job.audio_bytes:
+                data = f.read(min(block_size, job.audio_bytes - sent))
+                if not data:
+                    break
+                sent += len(data)
+                yield data
+            if job.done.is_set():
+                break
+            await job.audio_event.wait()
+
+async def stream_job_audio(job: Job, output_format: str = "wav"):
+    """Yield the job's audio in the requested format while it is being synthesized"""
+    mime_type = job.audio_mime_type or "audio/L16;rate=24000"
+    if output_format == "wav":
+        # Streaming header with the maximum length, followed by raw PCM
+        parameters = parse_audio_mime_type(mime_type)
+        yield wav_header(parameters["rate"], parameters["bits_per_sample"], None)
+        async for data in tail_job_pcm(job):
+            yield data
+        return
+    
+    # Pipe the PCM through a live encoder, reading its output while feeding it
+    encoder = AudioEncoder(output_format)
+    await encoder.start(mime_type)
+    
+    async def feed():
         try:
-            audio_file_path = await asyncio.wait_for(
-                generate_conversational_audio(pdf_text, speaker1_config, speaker2_config, tone),
-                timeout=600.0  # 10 minutes
-            )
-        except asyncio.TimeoutError:
-            logger.error("Audio generation timed out after 10 minutes")
-            raise HTTPException(status_code=408, detail="Audio generation timed out. Please try with a smaller PDF.")
-        
-        total_time = time.time() - start_time
-        logger.info(f"Audio generation completed in {total_time:.1f} seconds")
-        
-        return FileResponse(
-            audio_file_path,
-            media_type="audio/wav",
-            filename="notebooklm_style_overview.wav"
+            async for data in tail_job_pcm(job):
+                await encoder.write(data, mime_type)
+        finally:
+            encoder.close_input()
+    
+    feeder = asyncio.create_task(feed())
+    try:
+        while True:
+            data = await encoder.process.stdout.read(64 * 1024)
+            if not data:
+                break
+            yield data
+        await feeder
+    finally:
+        feeder.cancel()
+        await encoder.abort()
+
+async def audio_file_response(request: Request, job: Job, output_format: str):
+    """Serve a completed job's audio, encoding the WAV on first request for another format"""
+    media_type, extension, _, _ = OUTPUT_FORMATS[output_format]
+    path = await job_audio_path(job, output_format)
+    return range_file_response(request, path, media_type, f"notebooklm_style_overview{extension}")
+
+async def job_audio_path(job: Job, output_format: str) -> str:
+    """Return the path of a completed job's audio in the given format, encoding it if needed"""
+    if not job.result_path or not os.path.exists(job.result_path):
+        raise HTTPException(status_code=410, detail="Audio has expired, please generate it again")
+    path = job.result_path
+    if output_format != "wav":
+        path = job.encoded_paths.get(output_format)
+        if path is None or not os.path.exists(path):
+            # Keep the janitor away from the episode while the new encoding is written
+            artifact_store.pin(job.result_path)
+            try:
+                path = await encode_audio_file(job.result_path, output_format)
+            finally:
+                artifact_store.unpin(job.result_path)
+            job.encoded_paths[output_format] = path
+    return path
+
+def parse_range_header(range_header: str, file_size: int) -> Optional[tuple[int, int]]:
+    """Parse a single "bytes=start-end" range into inclusive offsets
+    
+    Returns None when the header should be ignored (multiple or malformed ranges) and raises
+    416 when the range lies outside the file.
+    """
+    match = re.fullmatch(r"\s*bytes=(\d*)-(\d*)\s*", range_header)
+    if not match or match.group(1) == match.group(2) == "":
+        return None
+    if match.group(1) == "":
+        # Suffix range: the last N bytes
+        length = int(match.group(2))
+        if length == 0:
+            start = file_size
+        else:
+            start = max(file_size - length, 0)
+        end = file_size - 1
+    else:
+        start = int(match.group(1))
+        end = min(int(match.group(2)), file_size - 1) if match.group(2) else file_size - 1
+    if start >= file_size or start > end:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{file_size}"}
         )
-        
+    return start, end
+
+async def read_file_range(path: str, start: int, end: int):
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            data = await asyncio.to_thread(f.read, min(DOWNLOAD_CHUNK_BYTES, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+
+def range_file_response(request: Request, path: str, media_type: str, filename: str):
+    """Serve a file, honouring a single byte range so players can seek without re-downloading"""
+    try:
+        file_size = os.path.getsize(path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=410, detail="Audio has expired, please generate it again")
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f'attachment; filename="{filename}"',
+    }
+    byte_range = None
+    range_header = request.headers.get("range")
+    if range_header:
+        byte_range = parse_range_header(range_header, file_size)
+    if byte_range is None:
+        return FileResponse(path, media_type=media_type, filename=filename, headers={"Accept-Ranges": "bytes"})
+    
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{file_size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        read_file_range(path, start, end),
+        status_code=206,
+        media_type=media_type,
+        headers=headers
+    )
+
+async def streaming_audio_response(request: Request, job: Job, output_format: str = "wav", owned: bool = False):
+    if job.status == "completed":
+        return await audio_file_response(request, job, output_format)
+    media_type, extension, _, _ = OUTPUT_FORMATS[output_format]
+    stream = stream_job_audio(job.leader or job, output_format)
+    return StreamingResponse(
+        cancel_when_abandoned(job, stream) if owned else stream,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="notebooklm_style_overview{extension}"'}
+    )
+
+@app.post("/pdf-to-notebooklm-audio")
+async def pdf_to_notebooklm_audio(
+    request: Request,
+    file: UploadFile = File(...),
+    speaker1_name: Optional[str] = Form(None),
+    speaker1_voice: Optional[str] = Form(None),
+    speaker2_name: Optional[str] = Form(None),
+    speaker2_voice: Optional[str] = Form(None),
+    tone: Optional[str] = Form("conversational"),
+    stream: bool = Form(False),
+    bypass_cache: bool = Form(False),
+    long_document: bool = Form(False),
+    output_format: Optional[str] = Form(None)
+):
+    """Convert a PDF and wait for the audio (synchronous wrapper around the job queue)"""
+    start_time = time.time()
+    logger.info(f"Starting PDF to audio conversion for file: {file.filename}")
+    output_format = negotiate_output_format(output_format, request.headers.get("accept"))
+    
+    try:
+        job = await create_job(
+            file, speaker1_name, speaker1_voice, speaker2_name, speaker2_voice, tone,
+            bypass_cache, long_document, output_format, client_identity(request)
+        )
+        if stream:
+            # Start sending audio as soon as the first TTS chunk is decoded
+            await wait_or_cancel(request, [job], wait_for_first_audio(job))
+            logger.info(f"Streaming audio after {time.time() - start_time:.1f} seconds")
+            return await streaming_audio_response(request, job, output_format, owned=True)
+        await wait_or_cancel(request, [job], job.done.wait())
+    except HTTPException:
+        raise
     except Exception as e:
         error_time = time.time() - start_time
         logger.error(f"Error in PDF to audio conversion after {error_time:.1f}s: {str(e)}")
-        logger.error(f"Error type: {type(e).__name__}")
-        import traceback
         logger.error(f"Traceback: {traceback.format_exc()}")
-        
-        # Return a more specific error message
-        if "GEMINI_API_KEY" in str(e) or "api_key" in str(e):
-            raise HTTPException(status_code=500, detail="API key configuration error")
-        elif "quota" in str(e).lower() or "limit" in str(e).lower():
-            raise HTTPException(status_code=429, detail="API quota exceeded. Please try again later.")
-        elif "timeout" in str(e).lower() or "deadline" in str(e).lower():
-            raise HTTPException(status_code=408, detail="Request timeout. Please try with a smaller PDF.")
-        else:
-            raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)[:100]}")
+        raise error_to_http_exception(e)
+    
+    if job.status != "completed":
+        raise HTTPException(status_code=job.error_status or 500, detail=job.error)
+    
+    total_time = time.time() - start_time
+    logger.info(f"Audio generation completed in {total_time:.1f} seconds")
+    
+    return await audio_file_response(request, job, output_format)
+
+@app.post("/jobs", status_code=202)
+async def submit_job(
+    request: Request,
+    file: UploadFile = File(...),
+    speaker1_name: Optional[str] = Form(None),
+    speaker1_voice: Optional[str] = Form(None),
+    speaker2_name: Optional[str] = Form(None),
+    speaker2_voice: Optional[str] = Form(None),
+    tone: Optional[str] = Form("conversational"),
+    bypass_cache: bool = Form(False),
+    long_document: bool = Form(False),
+    output_format: Optional[str] = Form(None)
+):
+    """Submit a PDF for conversion and return immediately with a job id"""
+    logger.info(f"Submitting conversion job for file: {file.filename}")
+    output_format = negotiate_output_format(output_format, None)
+    job = await create_job(
+        file, speaker1_name, speaker1_voice, speaker2_name, speaker2_voice, tone,
+        bypass_cache, long_document, output_format, client_identity(request)
+    )
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": f"/jobs/{job.id}",
+        "audio_url": f"/jobs/{job.id}/audio",
+    }
+
+@app.post("/batch")
+async def submit_batch(
+    request: Request,
+    files: List[UploadFile] = File(...),
+    variants: str = Form(...),
+    archive: bool = Form(False),
+    bypass_cache: bool = Form(False),
+    output_format: Optional[str] = Form(None)
+):
+    """Convert PDFs in several tone and voice variants, extracting each PDF and writing each tone's script once
+    
+    Returns a job handle per PDF and variant, or with `archive` waits for all of them and
+    returns a zip of the episodes.
+    """
+    output_format = negotiate_output_format(output_format, None)
+    jobs = await create_batch_jobs(
+        files, parse_batch_variants(variants), bypass_cache, output_format, client_identity(request)
+    )
+    if not archive:
+        return JSONResponse(status_code=202, content={
+            "batch_id": jobs[0].batch_id,
+            "jobs": [
+                {
+                    "job_id": job.id,
+                    "filename": job.filename,
+                    "tone": job.tone,
+                    "speakers": [job.speaker1.model_dump(), job.speaker2.model_dump()],
+                    "status": job.status,
+                    "status_url": f"/jobs/{job.id}",
+                    "audio_url": f"/jobs/{job.id}/audio",
+                }
+                for job in jobs
+            ],
+        })
+    
+    await wait_or_cancel(request, jobs, asyncio.gather(*(job.done.wait() for job in jobs)))
+    failed = [job for job in jobs if job.status != "completed"]
+    if len(failed) == len(jobs):
+        raise HTTPException(status_code=failed[0].error_status or 500, detail=failed[0].error)
+    archive_path = await build_batch_archive(jobs, output_format)
+    return range_file_response(request, archive_path, "application/zip", "notebooklm_batch.zip")
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Get the stage and progress of a conversion job"""
+    return (await job_manager.get(job_id)).to_dict()
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancel a queued or running job, stopping its Gemini calls and deleting its partial audio"""
+    job = await job_manager.get(job_id)
+    if job.remote and not job.done.is_set():
+        raise HTTPException(status_code=409, detail="Job is running on another worker and cannot be cancelled from here")
+    if not job_manager.cancel(job, "cancelled by request"):
+        raise HTTPException(status_code=409, detail=f"Job is already {job.status}")
+    if job.followers:
+        # Identical jobs still wait on this one, it reports cancelled once it has finished for them
+        return job.to_dict()
+    await job.done.wait()
+    return job.to_dict()
+
+@app.get("/jobs/{job_id}/script")
+async def get_job_script(job_id: str):
+    """Get the script a completed job was synthesized from, ready to be edited"""
+    job = await job_manager.get(job_id)
+    if job.script is None:
+        raise HTTPException(status_code=409, detail="No script is available for this job")
+    return {"job_id": job.id, "tone": job.tone, "speakers": [job.speaker1.model_dump(), job.speaker2.model_dump()], "script": job.script}
+
+@app.post("/jobs/{job_id}/script", status_code=202)
+async def resynthesize_job(job_id: str, edit: ScriptEdit, request: Request, format: Optional[str] = None):
+    """Synthesize an edited version of a job's script, re-synthesizing only the segments that changed"""
+    source = await job_manager.get(job_id)
+    if source.status != "completed" or source.segments is None:
+        raise HTTPException(status_code=409, detail="Only completed jobs that synthesized a script can be edited")
+    output_format = negotiate_output_format(format, None, source.output_format)
+    speaker_names = [source.speaker1.name]
+    if source.tone not in ("recursive", "single_speaker"):
+        speaker_names.append(source.speaker2.name)
+    if not parse_script_turns(edit.script, speaker_names):
+        raise HTTPException(status_code=400, detail="The edited script has no speaker turns")
+    
+    job = Job(
+        id=str(uuid.uuid4()),
+        filename=source.filename,
+        pdf_path=None,
+        speaker1=source.speaker1,
+        speaker2=source.speaker2,
+        tone=source.tone,
+        long_document=source.long_document,
+        output_format=output_format,
+        script=edit.script,
+        previous_segments=source.segments,
+        source_job_id=source.id,
+        client_id=client_identity(request),
+    )
+    await job_manager.submit(job)
+    logger.info(f"Re-synthesizing job {source.id} as {job.id}")
+    return {
+        "job_id": job.id,
+        "source_job_id": source.id,
+        "status": job.status,
+        "status_url": f"/jobs/{job.id}",
+        "audio_url": f"/jobs/{job.id}/audio",
+    }
+
+@app.get("/jobs/{job_id}/stream")
+async def stream_job(job_id: str, request: Request, format: Optional[str] = None):
+    """Stream the audio of a job while it is still being synthesized"""
+    job = await job_manager.get(job_id)
+    output_format = negotiate_output_format(format, request.headers.get("accept"), job.output_format)
+    if job.remote and job.status != "completed":
+        raise HTTPException(status_code=409, detail="Job is running on another worker, poll its status and download the audio when it completes")
+    await wait_for_first_audio(job)
+    return await streaming_audio_response(request, job, output_format)
+
+@app.get("/jobs/{job_id}/audio")
+async def get_job_audio(job_id: str, request: Request, format: Optional[str] = None):
+    """Download the audio produced by a completed job"""
+    job = await job_manager.get(job_id)
+    output_format = negotiate_output_format(format, request.headers.get("accept"), job.output_format)
+    if job.status == "failed":
+        raise HTTPException(status_code=job.error_status or 500, detail=job.error)
+    if job.status != "completed":
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+    return await audio_file_response(request, job, output_format)
+
+@app.get("/artifacts/{artifact_id}")
+async def get_artifact(artifact_id: str, request: Request, format: Optional[str] = None):
+    """Download a generated episode by artifact id, with byte-range support for seeking"""
+    output_format = format or "wav"
+    if output_format not in OUTPUT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported output format: {output_format}")
+    media_type, extension, _, _ = OUTPUT_FORMATS[output_format]
+    path = artifact_store.find(artifact_id, extension)
+    return range_file_response(request, path, media_type, f"notebooklm_style_overview{extension}")
+
+def normalize_speaker(name: Optional[str], voice: Optional[str], default_voice: str) -> tuple[str, str]:
+    """Normalize a requested speaker name and voice, falling back to default_voice for unknown voices
+    
+    An empty name means the speaker gets a default one. The speaker configs and the result cache key
+    both go through here, so a request is always cached under the voices it is synthesized with.
+    """
+    voice = (voice or "").strip().lower()
+    return (name or "").strip(), voice if voice in AVAILABLE_VOICES else default_voice
 
 def generate_speaker_configs(
     speaker1_name: Optional[str],
@@ -203,51 +2360,323 @@ def generate_speaker_configs(
     available_names = DEFAULT_SPEAKER_NAMES.copy()
     random.shuffle(available_names)
     
-    # Speaker 1 configuration
+    # Speaker 1 configuration, zephyr is the default analytical voice
+    speaker1_name, speaker1_voice = normalize_speaker(speaker1_name, speaker1_voice, "zephyr")
     if not speaker1_name:
         speaker1_name = available_names.pop()
-    if not speaker1_voice or speaker1_voice not in AVAILABLE_VOICES:
-        speaker1_voice = "zephyr"  # Default analytical voice
         
-    # Speaker 2 configuration  
+    # Speaker 2 configuration, puck is the default enthusiastic voice
+    speaker2_name, speaker2_voice = normalize_speaker(speaker2_name, speaker2_voice, "puck")
     if not speaker2_name:
         # Ensure different name from speaker 1
         speaker2_name = next((name for name in available_names if name != speaker1_name), "Jordan")
-    if not speaker2_voice or speaker2_voice not in AVAILABLE_VOICES:
-        speaker2_voice = "puck"  # Default enthusiastic voice
         
     speaker1_config = SpeakerConfig(name=speaker1_name, voice=speaker1_voice)
     speaker2_config = SpeakerConfig(name=speaker2_name, voice=speaker2_voice)
     
     return speaker1_config, speaker2_config
 
-def extract_text_from_pdf(pdf_content: bytes) -> str:
-    text = ""
-    pdf_file = io.BytesIO(pdf_content)
-    pdf_reader = PyPDF2.PdfReader(pdf_file)
+@contextmanager
+def open_pdf(pdf_path: str):
+    """Open a PDF through a read-only memory map so pages are read from the file on demand"""
+    with open(pdf_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        yield PyPDF2.PdfReader(data)
+
+def extract_text_from_pdf(pdf_path: str, max_chars: Optional[int] = None) -> str:
+    """Extract text page by page, stopping once max_chars characters have been collected"""
+    parts = []
+    total_chars = 0
+    
+    with open_pdf(pdf_path) as pdf_reader:
+        for page in pdf_reader.pages:
+            page_text = page.extract_text() + "\n"
+            parts.append(page_text)
+            total_chars += len(page_text)
+            if max_chars is not None and total_chars >= max_chars:
+                break
+    
+    return "".join(parts)
+
+def extract_pdf_page_range(pdf_path: str, start: int, end: int) -> str:
+    """Extract the text of pages [start, end), run inside the PDF process pool"""
+    with open_pdf(pdf_path) as pdf_reader:
+        return "".join(pdf_reader.pages[i].extract_text() + "\n" for i in range(start, end))
+
+def count_pdf_pages(pdf_path: str) -> int:
+    with open_pdf(pdf_path) as pdf_reader:
+        return len(pdf_reader.pages)
+
+def get_pdf_process_pool() -> ProcessPoolExecutor:
+    global pdf_process_pool
+    if pdf_process_pool is None:
+        pdf_process_pool = ProcessPoolExecutor(max_workers=PDF_EXTRACT_PROCESSES)
+    return pdf_process_pool
+
+async def extract_pdf_text(pdf_path: str, max_chars: Optional[int] = None) -> str:
+    """Extract PDF text off the event loop
+    
+    With a character budget only the leading pages are parsed. Whole-document extraction of
+    large PDFs is split into page ranges parsed in parallel by the process pool.
+    """
+    if max_chars is None and PDF_EXTRACT_PROCESSES > 1:
+        page_count = await asyncio.to_thread(count_pdf_pages, pdf_path)
+        if page_count >= PDF_PARALLEL_MIN_PAGES:
+            pages_per_range = -(-page_count // PDF_EXTRACT_PROCESSES)
+            loop = asyncio.get_running_loop()
+            pool = get_pdf_process_pool()
+            logger.info(f"Extracting {page_count} pages across {PDF_EXTRACT_PROCESSES} processes")
+            parts = await asyncio.gather(*[
+                loop.run_in_executor(
+                    pool, extract_pdf_page_range, pdf_path, start, min(start + pages_per_range, page_count)
+                )
+                for start in range(0, page_count, pages_per_range)
+            ])
+            return "".join(parts)
+    
+    return await asyncio.to_thread(extract_text_from_pdf, pdf_path, max_chars)
+
+class TokenBucket:
+    """Token bucket holding up to one minute of budget, refilled continuously"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self, amount: float = 1.0):
+        if self.rate <= 0:
+            return
+        amount = min(amount, self.capacity)
+        # Waiters queue on the lock, so the budget is handed out in arrival order
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+class ModelRateLimiter:
+    """Paces calls to one Gemini model
+    
+    Requests and tokens are drawn from per-minute token buckets, and the number of calls in
+    flight follows additive-increase/multiplicative-decrease: it halves on every 429 and
+    grows back by one after a window of successful calls.
+    """
+
+    def __init__(self, model: str, rpm: float, tpm: float, max_concurrency: int):
+        self.model = model
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_concurrency = max_concurrency
+        self.concurrency = max_concurrency
+        self.in_flight = 0
+        self.successes = 0
+        self.rate_limited = 0
+        self.condition = asyncio.Condition()
+
+    @asynccontextmanager
+    async def slot(self, estimated_tokens: int):
+        await self.requests.acquire(1)
+        await self.tokens.acquire(estimated_tokens)
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < self.concurrency)
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            async with self.condition:
+                self.in_flight -= 1
+                self.condition.notify_all()
+
+    def record_success(self):
+        self.successes += 1
+        if self.concurrency < self.max_concurrency and self.successes >= self.concurrency:
+            self.concurrency += 1
+            self.successes = 0
+
+    def record_rate_limited(self):
+        self.rate_limited += 1
+        self.successes = 0
+        if self.concurrency > 1:
+            self.concurrency = max(1, self.concurrency // 2)
+            logger.warning(f"{self.model} is rate limited, reducing concurrency to {self.concurrency}")
+
+rate_limiters = {
+    SCRIPT_MODEL: ModelRateLimiter(SCRIPT_MODEL, SCRIPT_MODEL_RPM, SCRIPT_MODEL_TPM, SCRIPT_CONCURRENCY),
+    TTS_MODEL: ModelRateLimiter(TTS_MODEL, TTS_MODEL_RPM, TTS_MODEL_TPM, TTS_CONCURRENCY),
+}
+
+class IncompleteAudioError(Exception):
+    """A TTS stream ended without usable audio, worth another attempt"""
+
+PASSAGE_BREAK = "\x00"
+PUNCTUATION_TO_SPACE = str.maketrans({character: " " for character in string.punctuation})
+PASSAGE_STOPWORDS = frozenset("""
+    the and for are but not you all any can had her was one our out has him his how its may new now
+    see two who did get let put say she too use that with have this will your from they been were
+    said each which their there what about would make like into than them then these some could
+    other more also only over such when where while most very just those through after before
+    because between both being under does done same should upon whom within without
+""".split())
+
+def split_passages(text: str, passage_chars: int = PASSAGE_CHARS) -> List[str]:
+    """Split text into passages of at most passage_chars, ending on sentence boundaries where possible"""
+    # Whitespace is normalized, and stray NULs dropped so they cannot be mistaken for passage breaks
+    text = " ".join(text.replace(PASSAGE_BREAK, " ").split())
+    passages = []
+    start = 0
+    while start < len(text):
+        end = start + passage_chars
+        if end < len(text):
+            cut = max(text.rfind(". ", start, end), text.rfind("? ", start, end), text.rfind("! ", start, end))
+            if cut > start:
+                end = cut + 1
+            elif (space := text.rfind(" ", start, end)) > start:
+                # Text without punctuation, such as tables, is cut between words
+                end = space
+        passages.append(text[start:end].strip())
+        start = end
+    return passages
+
+def score_passages(passages: List[str]) -> np.ndarray:
+    """Score passages by the cosine similarity of their TF-IDF vector to the whole document's
+    
+    Passages covering the terms the document keeps returning to score highest, boilerplate
+    and off-topic passages lowest.
+    """
+    num_passages = len(passages)
+    # Tokenize everything in one pass, a break token between passages marks where each one starts
+    terms = f" {PASSAGE_BREAK} ".join(passages).lower().translate(PUNCTUATION_TO_SPACE).split()
+    vocabulary = {term: index for index, term in enumerate(dict.fromkeys(terms))}
+    num_terms = len(vocabulary)
+    term_ids = np.fromiter(map(vocabulary.__getitem__, terms), dtype=np.int64, count=len(terms))
+    passage_ids = np.cumsum(term_ids == vocabulary.get(PASSAGE_BREAK, -1))
+    
+    # Short words, numbers and stopwords say little about what a passage covers
+    ignored = np.fromiter(
+        (len(term) < 3 or not term[0].isalpha() or term in PASSAGE_STOPWORDS for term in vocabulary),
+        dtype=bool, count=num_terms,
+    )
+    keep = ~ignored[term_ids]
+    if not keep.any():
+        return np.zeros(num_passages)
+    
+    # Sparse passage x term counts as (passage, term, count) triples
+    pairs, counts = np.unique(passage_ids[keep] * num_terms + term_ids[keep], return_counts=True)
+    rows, cols = pairs // num_terms, pairs % num_terms
+    document_frequency = np.bincount(cols, minlength=num_terms)
+    idf = np.log((1 + num_passages) / (1 + document_frequency)) + 1
+    weights = (1 + np.log(counts)) * idf[cols]
+    
+    centroid = np.bincount(cols, weights=weights, minlength=num_terms) / num_passages
+    dot = np.bincount(rows, weights=weights * centroid[cols], minlength=num_passages)
+    norms = np.sqrt(np.bincount(rows, weights=weights * weights, minlength=num_passages))
+    return dot / np.maximum(norms * np.linalg.norm(centroid), 1e-12)
+
+def select_passages(text: str, budget_chars: int) -> str:
+    """Fit a document into budget_chars by keeping its most central passages, in document order
+    
+    Falls back to the start of the document when passage selection is disabled.
+    """
+    if len(text) <= budget_chars:
+        return text
+    if not PASSAGE_SELECTION:
+        return text[:budget_chars] + "..."
     
-    for page in pdf_reader.pages:
-        text += page.extract_text() + "\n"
+    passages = split_passages(text)
+    scores = score_passages(passages)
+    # The opening usually carries the title and abstract, so it is always kept when it fits
+    scores[0] = np.inf
+    gap = "\n[...]\n"
+    selected = []
+    used = 0
+    for index in np.argsort(-scores, kind="stable"):
+        cost = len(passages[index]) + len(gap)
+        if used + cost <= budget_chars:
+            selected.append(index)
+            used += cost
+    if not selected:
+        return text[:budget_chars] + "..."
     
-    return text
+    selected.sort()
+    parts = [passages[selected[0]]]
+    for previous, index in zip(selected, selected[1:]):
+        parts.append((" " if index == previous + 1 else gap) + passages[index])
+    if selected[-1] != len(passages) - 1:
+        parts.append(gap)
+    return "".join(parts)
+
+def estimate_tokens(text: str) -> int:
+    # Roughly four characters per token for English text
+    return max(1, len(text) // 4)
+
+def is_rate_limit_error(e: Exception) -> bool:
+    return isinstance(e, genai_errors.APIError) and e.code == 429
+
+def is_retryable_error(e: Exception) -> bool:
+    if isinstance(e, genai_errors.APIError):
+        return e.code in (408, 429, 500, 502, 503, 504)
+    return isinstance(e, (httpx.TransportError, asyncio.TimeoutError, IncompleteAudioError))
+
+async def call_with_retries(model: str, attempt, estimated_tokens: int, description: str, max_retries: int = GEMINI_MAX_RETRIES):
+    """Run `attempt` inside the model's rate limiter, retrying retryable errors with jittered exponential backoff"""
+    limiter = rate_limiters[model]
+    for attempt_number in range(max_retries + 1):
+        try:
+            async with limiter.slot(estimated_tokens):
+                result = await attempt()
+            limiter.record_success()
+            return result
+        except Exception as e:
+            if is_rate_limit_error(e):
+                limiter.record_rate_limited()
+            if attempt_number == max_retries or not is_retryable_error(e):
+                raise
+            reason = "rate_limited" if is_rate_limit_error(e) else type(e).__name__
+            metrics.inc("notebooklm_gemini_retries_total", model=model, reason=reason)
+            # Full jitter spreads out retries from concurrent jobs hitting the same limit
+            delay = random.uniform(0, min(GEMINI_RETRY_MAX_SECONDS, GEMINI_RETRY_BASE_SECONDS * 2 ** attempt_number))
+            logger.warning(f"{description} attempt {attempt_number + 1} failed ({e}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+async def gemini_generate_content(
+    client: genai.Client,
+    model: str,
+    contents: List[types.Content],
+    config: types.GenerateContentConfig
+) -> types.GenerateContentResponse:
+    """Call generate_content through the model's rate limiter with retries"""
+    prompt_chars = sum(len(part.text or "") for content in contents for part in content.parts)
+    return await call_with_retries(
+        model,
+        lambda: client.aio.models.generate_content(model=model, contents=contents, config=config),
+        max(1, prompt_chars // 4),
+        f"{model} request",
+    )
 
 async def generate_conversation_script(
     client: genai.Client, 
     pdf_text: str, 
     speaker1_config: SpeakerConfig, 
     speaker2_config: SpeakerConfig, 
-    tone: str
+    tone: str,
+    text_budget: int = PROMPT_TEXT_CHARS
 ) -> str:
     """Generate conversational script using regular Gemini"""
     logger.info("Generating conversation script...")
     start_time = time.time()
     
     conversation_prompt = create_conversation_prompt(
-        pdf_text, speaker1_config, speaker2_config, tone
+        pdf_text, speaker1_config, speaker2_config, tone, text_budget
     )
     
     # Use regular Gemini model for text generation
-    model = "gemini-1.5-flash"
+    model = SCRIPT_MODEL
     contents = [
         types.Content(
             role="user",
@@ -259,7 +2688,8 @@ async def generate_conversation_script(
     
     config = types.GenerateContentConfig(temperature=0.8)
     
-    response = client.models.generate_content(
+    response = await gemini_generate_content(
+        client,
         model=model,
         contents=contents,
         config=config,
@@ -274,7 +2704,8 @@ async def generate_conversation_script(
 async def generate_recursive_explanation_script(
     client: genai.Client, 
     pdf_text: str, 
-    speaker_config: SpeakerConfig
+    speaker_config: SpeakerConfig,
+    text_budget: int = PROMPT_TEXT_CHARS
 ) -> str:
     """Generate a recursive explanation script using IEE approach with web research"""
     logger.info("Generating recursive explanation script...")
@@ -283,40 +2714,25 @@ async def generate_recursive_explanation_script(
     # First, extract key topics from the PDF for web research
     topics_prompt = f"""Extract the 3-5 most important topics/concepts from this document that would benefit from additional background research. List them as simple phrases, one per line:
 
-{pdf_text[:2000]}"""
+{select_passages(pdf_text, text_budget // 2)}"""
     
-    topics_response = client.models.generate_content(
-        model="gemini-1.5-flash",
+    topics_response = await gemini_generate_content(
+        client,
+        model=SCRIPT_MODEL,
         contents=[types.Content(role="user", parts=[types.Part.from_text(text=topics_prompt)])],
         config=types.GenerateContentConfig(temperature=0.3)
     )
     
-    topics = topics_response.text.strip().split('\n')[:3]  # Limit to 3 topics for performance
+    topics = [topic.strip() for topic in topics_response.text.strip().split('\n') if topic.strip()][:3]  # Limit to 3 topics for performance
     logger.info(f"Identified research topics: {topics}")
     
-    # Conduct web research for background information
-    background_info = ""
-    try:
-        import requests
-        from urllib.parse import quote
-        
-        for topic in topics:
-            if topic.strip():
-                # Simple web search simulation (you could integrate with actual search API)
-                search_query = f"background history context {topic.strip()}"
-                logger.info(f"Researching: {search_query}")
-                
-                # For now, we'll use Gemini to generate research-like content
-                research_prompt = f"Provide historical background, key developments, and contextual information about: {topic.strip()}"
-                research_response = client.models.generate_content(
-                    model="gemini-1.5-flash",
-                    contents=[types.Content(role="user", parts=[types.Part.from_text(text=research_prompt)])],
-                    config=types.GenerateContentConfig(temperature=0.4)
-                )
-                background_info += f"\n\nBackground on {topic.strip()}:\n{research_response.text[:500]}..."
-                
-    except Exception as e:
-        logger.warning(f"Web research failed: {e}")
+    # Research every topic concurrently, a slow or failed topic is simply left out
+    research = await asyncio.gather(*[research_topic(client, topic) for topic in topics])
+    background_info = "".join(
+        f"\n\nBackground on {topic}:\n{result}..."
+        for topic, result in zip(topics, research) if result
+    )
+    if not background_info:
         background_info = "Additional research was attempted but not available for this session."
     
     # Create the recursive explanation prompt using IEE format
@@ -342,14 +2758,15 @@ Background research context:
 {background_info}
 
 Document content to explain:
-{pdf_text[:3000]}
+{select_passages(pdf_text, text_budget * 3 // 4)}
 
 Format as: {speaker_config.name}: [speech content]
 
 Create the complete recursive explanation:"""
     
-    response = client.models.generate_content(
-        model="gemini-1.5-flash",
+    response = await gemini_generate_content(
+        client,
+        model=SCRIPT_MODEL,
         contents=[types.Content(role="user", parts=[types.Part.from_text(text=recursive_prompt)])],
         config=types.GenerateContentConfig(temperature=0.7)
     )
@@ -360,20 +2777,88 @@ Create the complete recursive explanation:"""
     
     return response.text
 
+class TTLCache:
+    """Small in-memory cache whose entries expire after a fixed time to live"""
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.time():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: str):
+        self.entries[key] = (time.time() + self.ttl_seconds, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+research_cache = TTLCache(RESEARCH_CACHE_TTL_SECONDS, RESEARCH_CACHE_MAX_ENTRIES)
+
+def normalize_topic(topic: str) -> str:
+    """Normalize a topic line so the same topic from different documents shares a cache entry"""
+    topic = re.sub(r"^\s*(?:[-*\u2022]|\d+[.)])\s*", "", topic)
+    topic = topic.replace("*", "").strip(" .:").lower()
+    return re.sub(r"\s+", " ", topic)
+
+async def research_topic(client: genai.Client, topic: str) -> Optional[str]:
+    """Fetch background information on a topic, or None if it fails or times out"""
+    key = normalize_topic(topic)
+    cached = research_cache.get(key)
+    if cached is not None:
+        logger.info(f"Research cache hit: {key}")
+        return cached
+    
+    # Simple web search simulation (you could integrate with actual search API)
+    search_query = f"background history context {topic}"
+    logger.info(f"Researching: {search_query}")
+    
+    # For now, we'll use Gemini to generate research-like content
+    research_prompt = f"Provide historical background, key developments, and contextual information about: {topic}"
+    
+    try:
+        research_response = await asyncio.wait_for(
+            gemini_generate_content(
+                client,
+                model=SCRIPT_MODEL,
+                contents=[types.Content(role="user", parts=[types.Part.from_text(text=research_prompt)])],
+                config=types.GenerateContentConfig(temperature=0.4)
+            ),
+            timeout=RESEARCH_TIMEOUT_SECONDS
+        )
+    except asyncio.TimeoutError:
+        logger.warning(f"Research on {topic!r} timed out after {RESEARCH_TIMEOUT_SECONDS:.0f}s")
+        return None
+    except Exception as e:
+        logger.warning(f"Research on {topic!r} failed: {e}")
+        return None
+    
+    result = research_response.text[:500]
+    research_cache.set(key, result)
+    return result
+
 async def generate_single_speaker_script(
     client: genai.Client, 
     pdf_text: str, 
     speaker_config: SpeakerConfig,
-    tone: str
+    tone: str,
+    text_budget: int = PROMPT_TEXT_CHARS
 ) -> str:
     """Generate a single-speaker script for professional narration"""
     logger.info("Generating single-speaker script...")
     start_time = time.time()
     
-    # Truncate text to fit within context limits
-    max_text_length = 4000
-    if len(pdf_text) > max_text_length:
-        pdf_text = pdf_text[:max_text_length] + "..."
+    # Keep the most informative passages that fit within context limits
+    pdf_text = select_passages(pdf_text, text_budget)
     
     # Get tone-specific instruction
     tone_instruction = TONE_PRESETS.get(tone, TONE_PRESETS["conversational"])["prompt_addition"]
@@ -402,8 +2887,9 @@ Create the complete single-speaker script:"""
     
     config = types.GenerateContentConfig(temperature=0.8)
     
-    response = client.models.generate_content(
-        model="gemini-1.5-flash",
+    response = await gemini_generate_content(
+        client,
+        model=SCRIPT_MODEL,
         contents=contents,
         config=config,
     )
@@ -414,55 +2900,512 @@ Create the complete single-speaker script:"""
     
     return response.text
 
+def split_into_sections(text: str, section_chars: int) -> List[str]:
+    """Split text into sections of roughly section_chars, breaking on paragraph or line boundaries"""
+    sections = []
+    start = 0
+    while start < len(text):
+        end = min(start + section_chars, len(text))
+        if end < len(text):
+            # Prefer a paragraph break, then a line break, in the second half of the window
+            for separator in ("\n\n", "\n", ". "):
+                boundary = text.rfind(separator, start + section_chars // 2, end)
+                if boundary != -1:
+                    end = boundary + len(separator)
+                    break
+        section = text[start:end].strip()
+        if section:
+            sections.append(section)
+        start = end
+    return sections
+
+async def summarize_section(
+    client: genai.Client,
+    section: str,
+    index: int,
+    total: int,
+    max_chars: int,
+    semaphore: asyncio.Semaphore
+) -> str:
+    """Summarize one section of a long document"""
+    prompt = f"""Summarize part {index + 1} of {total} of a long document in at most {max_chars} characters. Keep the key facts, figures, names, arguments and conclusions. Write plain prose without headings.
+
+{section}"""
+    
+    async with semaphore:
+        response = await gemini_generate_content(
+            client,
+            model=SCRIPT_MODEL,
+            contents=[types.Content(role="user", parts=[types.Part.from_text(text=prompt)])],
+            config=types.GenerateContentConfig(temperature=0.3)
+        )
+    return response.text.strip()[:max_chars]
+
+async def generate_document_digest(client: genai.Client, pdf_text: str) -> str:
+    """Map-reduce a long document into a digest that fits the script prompt
+    
+    The text is split into at most LONG_DOCUMENT_MAX_SECTIONS sections that are summarized
+    concurrently, then the summaries are merged in document order.
+    """
+    if len(pdf_text) <= LONG_DOCUMENT_DIGEST_CHARS:
+        return pdf_text
+    
+    logger.info("Generating long document digest...")
+    start_time = time.time()
+    
+    section_chars = max(LONG_DOCUMENT_SECTION_CHARS, -(-len(pdf_text) // LONG_DOCUMENT_MAX_SECTIONS))
+    sections = split_into_sections(pdf_text, section_chars)
+    summary_chars = max(200, LONG_DOCUMENT_DIGEST_CHARS // len(sections) - 20)
+    semaphore = asyncio.Semaphore(LONG_DOCUMENT_CONCURRENCY)
+    
+    with stage_timer("digest", sections=len(sections)):
+        summaries = await asyncio.gather(*[
+            summarize_section(client, section, i, len(sections), summary_chars, semaphore)
+            for i, section in enumerate(sections)
+        ])
+    digest = "\n\n".join(
+        f"Part {i + 1}: {summary}" for i, summary in enumerate(summaries) if summary
+    )
+    
+    digest_time = time.time() - start_time
+    logger.info(f"Condensed {len(pdf_text)} characters in {len(sections)} sections to a {len(digest)} character digest in {digest_time:.1f}s")
+    return digest
+
+def parse_script_turns(script: str, speaker_names: List[str]) -> List[tuple[str, str]]:
+    """Parse a script in the `Name: text` format into (speaker, text) turns
+    
+    Lines that do not start with a known speaker label continue the previous turn.
+    """
+    turns = []
+    for line in script.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        # Models sometimes emphasize labels, e.g. **Alex:** or *Alex*:
+        label, separator, text = line.replace("*", "").partition(":")
+        label = label.strip()
+        if separator and label in speaker_names:
+            turns.append((label, text.strip()))
+        elif turns:
+            turns[-1] = (turns[-1][0], f"{turns[-1][1]} {line}".strip())
+        else:
+            turns.append((speaker_names[0], line))
+    return [(speaker, text) for speaker, text in turns if text]
+
+def format_script_turns(turns: List[tuple[str, str]]) -> str:
+    return "\n".join(f"{speaker}: {text}" for speaker, text in turns)
+
+def split_turn(text: str, max_chars: int) -> List[str]:
+    """Split an oversized turn on sentence boundaries into pieces of at most max_chars"""
+    if len(text) <= max_chars:
+        return [text]
+    pieces = []
+    for sentence in re.split(r"(?<=[.!?])\s+", text.strip()):
+        if pieces and len(pieces[-1]) + len(sentence) + 1 <= max_chars:
+            pieces[-1] = f"{pieces[-1]} {sentence}"
+        else:
+            pieces.append(sentence)
+    return pieces
+
+def split_script_turns(
+    turns: List[tuple[str, str]],
+    max_chars: int,
+    first_chars: Optional[int] = None
+) -> List[tuple[str, str]]:
+    """Split turns into the pieces segments are built from, splitting oversized turns on sentences
+    
+    The opening piece is kept within first_chars, so the first segment can be short.
+    """
+    first_limit = min(first_chars or max_chars, max_chars)
+    pieces = []
+    for index, (speaker, text) in enumerate(turns):
+        turn_pieces = split_turn(text, first_limit if index == 0 else max_chars)
+        if index == 0 and len(turn_pieces) > 1:
+            # Only the opening piece needs to be short; the rest of the turn splits as usual
+            turn_pieces = turn_pieces[:1] + split_turn(" ".join(turn_pieces[1:]), max_chars)
+        pieces.extend((speaker, piece) for piece in turn_pieces)
+    return pieces
+
+def group_pieces(
+    pieces: List[tuple[str, str]],
+    max_chars: int,
+    first_chars: Optional[int] = None
+) -> List[List[tuple[str, str]]]:
+    """Group consecutive pieces into segments of at most max_chars, the first of at most first_chars"""
+    segments = []
+    current = []
+    current_chars = 0
+    first_limit = min(first_chars or max_chars, max_chars)
+    
+    for speaker, piece in pieces:
+        limit = max_chars if segments else first_limit
+        turn_chars = len(speaker) + len(piece) + 3
+        if current and current_chars + turn_chars > limit:
+            segments.append(current)
+            current = []
+            current_chars = 0
+        current.append((speaker, piece))
+        current_chars += turn_chars
+    
+    if current:
+        segments.append(current)
+    return segments
+
+def group_turns_into_segments(
+    turns: List[tuple[str, str]],
+    max_chars: int,
+    first_chars: Optional[int] = None
+) -> List[List[tuple[str, str]]]:
+    """Group consecutive turns into segments of at most max_chars, splitting oversized turns on sentences
+    
+    The first segment is capped at first_chars instead, since nothing can be streamed until it is synthesized
+    """
+    return group_pieces(split_script_turns(turns, max_chars, first_chars), max_chars, first_chars)
+
+def plan_edited_segments(
+    previous_segments: List[List[tuple[str, str]]],
+    turns: List[tuple[str, str]],
+    max_chars: int,
+    first_chars: Optional[int] = None
+) -> List[List[tuple[str, str]]]:
+    """Segment an edited script, reusing every previous segment whose turns survived the edit unchanged
+    
+    Turns are diffed against the previous version. Each run of changed turns, together with the
+    unchanged turns of segments the edit broke up, is grouped into segments again, so an edit
+    makes about as many TTS calls as the segments it touches.
+    """
+    # Split exactly like the original grouping, so unchanged turns yield the same pieces
+    pieces = split_script_turns(turns, max_chars, first_chars)
+    previous_pieces = [piece for segment in previous_segments for piece in segment]
+    segment_starts = {}
+    offset = 0
+    for segment in previous_segments:
+        segment_starts[offset] = segment
+        offset += len(segment)
+    
+    # Position in the previous script of every piece the edit left untouched
+    matched: List[Optional[int]] = [None] * len(pieces)
+    matcher = difflib.SequenceMatcher(None, previous_pieces, pieces, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            for k in range(i2 - i1):
+                matched[j1 + k] = i1 + k
+    
+    segments = []
+    touched = []
+    j = 0
+    while j < len(pieces):
+        i = matched[j]
+        segment = segment_starts.get(i) if i is not None else None
+        if segment is not None and all(
+            j + k < len(pieces) and matched[j + k] == i + k for k in range(len(segment))
+        ):
+            segments.extend(group_pieces(touched, max_chars, None if segments else first_chars))
+            touched = []
+            segments.append(segment)
+            j += len(segment)
+        else:
+            touched.append(pieces[j])
+            j += 1
+    segments.extend(group_pieces(touched, max_chars, None if segments else first_chars))
+    return segments
+
+def segment_cache_key(segment: List[tuple[str, str]], voices: dict[str, str], tone: str) -> str:
+    """Hash a segment's turns with the voices and tone it is read in"""
+    normalized = {
+        "turns": segment,
+        "voices": {speaker: voices.get(speaker) for speaker, _ in segment},
+        "tone": tone,
+        "model": TTS_MODEL,
+    }
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True).encode()).hexdigest()
+
+async def synthesize_segment(
+    client: genai.Client,
+    prompt_text: str,
+    config: types.GenerateContentConfig,
+    index: int
+) -> tuple[bytes, str]:
+    """Synthesize one script segment, retrying failed attempts
+    
+    Returns the segment's raw PCM and its MIME type.
+    """
+    contents = [
+        types.Content(
+            role="user",
+            parts=[
+                types.Part.from_text(text=prompt_text),
+            ],
+        ),
+    ]
+    
+    async def attempt() -> tuple[bytes, str]:
+        pcm_chunks = []
+        mime_type = None
+        stream = await client.aio.models.generate_content_stream(
+            model=TTS_MODEL,
+            contents=contents,
+            config=config,
+        )
+        try:
+            async for chunk in stream:
+                if (
+                    chunk.candidates is None
+                    or chunk.candidates[0].content is None
+                    or chunk.candidates[0].content.parts is None
+                ):
+                    continue
+            
+                if (chunk.candidates[0].content.parts[0].inline_data and 
+                    chunk.candidates[0].content.parts[0].inline_data.data):
+                
+                    inline_data = chunk.candidates[0].content.parts[0].inline_data
+                    pcm, chunk_mime_type = decode_audio_chunk(inline_data.data, inline_data.mime_type)
+                    if mime_type is None:
+                        mime_type = chunk_mime_type
+                    elif parse_audio_mime_type(chunk_mime_type) != parse_audio_mime_type(mime_type):
+                        raise IncompleteAudioError(f"Audio format changed within segment {index}")
+                    pcm_chunks.append(pcm)
+                else:
+                    # Log any text responses for debugging
+                    if hasattr(chunk, 'text') and chunk.text:
+                        logger.debug(f"Segment {index} generated text: {chunk.text}")
+        finally:
+            # Close the HTTP response right away when the job is cancelled or a chunk is rejected
+            aclose = getattr(stream, "aclose", None)
+            if aclose is not None:
+                await aclose()
+        
+        if not pcm_chunks:
+            raise IncompleteAudioError(f"No audio generated for segment {index}")
+        return b"".join(pcm_chunks), mime_type
+    
+    with stage_timer("tts_segment", segment=index, characters=len(prompt_text)):
+        return await call_with_retries(
+            TTS_MODEL, attempt, estimate_tokens(prompt_text), f"TTS segment {index}", TTS_SEGMENT_RETRIES
+        )
+
+async def synthesize_segment_cached(
+    client: genai.Client,
+    prompt_text: str,
+    config: types.GenerateContentConfig,
+    index: int,
+    cache_key: str,
+    read_cache: bool = True
+) -> tuple[bytes, str]:
+    """Synthesize a segment, reusing the audio of an identical segment from an earlier run
+    
+    With read_cache False the segment is always synthesized, and the fresh audio replaces the cached one.
+    """
+    cached_path = None
+    if read_cache:
+        cached_path = segment_cache.get(cache_key)
+        metrics.inc("notebooklm_cache_requests_total", cache="segment", result="hit" if cached_path else "miss")
+    if cached_path:
+        try:
+            return await asyncio.to_thread(read_segment_audio, cached_path)
+        except (OSError, wave.Error, EOFError) as e:
+            logger.warning(f"Ignoring unreadable cached segment {index}: {str(e)}")
+    
+    pcm, mime_type = await synthesize_segment(client, prompt_text, config, index)
+    
+    parameters = parse_audio_mime_type(mime_type)
+    tmp_path = os.path.join(SEGMENT_CACHE_DIR, f"{cache_key}.{uuid.uuid4().hex}.tmp")
+    try:
+        await asyncio.to_thread(
+            write_segment_audio, tmp_path, pcm, parameters["rate"], parameters["bits_per_sample"]
+        )
+        await segment_cache.put_async(cache_key, tmp_path)
+    except OSError as e:
+        logger.warning(f"Could not cache segment {index}: {str(e)}")
+    finally:
+        remove_file(tmp_path)
+    return pcm, mime_type
+
+def write_segment_audio(path: str, pcm: bytes, sample_rate: int, bits_per_sample: int):
+    with open(path, "wb") as f:
+        f.write(wav_header(sample_rate, bits_per_sample, len(pcm)))
+        f.write(pcm)
+
+def read_segment_audio(path: str) -> tuple[bytes, str]:
+    with wave.open(path, "rb") as wav_file:
+        mime_type = f"audio/L{wav_file.getsampwidth() * 8};rate={wav_file.getframerate()}"
+        return wav_file.readframes(wav_file.getnframes()), mime_type
+
+def silence_pcm(mime_type: str, duration_ms: int) -> bytes:
+    parameters = parse_audio_mime_type(mime_type)
+    bytes_per_sample = parameters["bits_per_sample"] // 8
+    return bytes(parameters["rate"] * duration_ms // 1000 * bytes_per_sample)
+
+def audio_postprocessing_settings() -> Optional[dict]:
+    """The settings that shape post-processed audio, part of the result cache key"""
+    if not AUDIO_POSTPROCESSING:
+        return None
+    return {
+        "target_dbfs": AUDIO_TARGET_DBFS,
+        "max_gain_db": AUDIO_MAX_GAIN_DB,
+        "silence_dbfs": AUDIO_SILENCE_DBFS,
+        "max_silence_ms": AUDIO_MAX_SILENCE_MS,
+        "block_ms": AUDIO_BLOCK_MS,
+        "sample_rate": AUDIO_OUTPUT_SAMPLE_RATE,
+    }
+
+def lowpass_filter(cutoff: float, num_taps: int = 101) -> np.ndarray:
+    """Windowed-sinc FIR low-pass with cutoff given as a fraction of the sample rate"""
+    offsets = np.arange(num_taps) - (num_taps - 1) / 2
+    taps = 2 * cutoff * np.sinc(2 * cutoff * offsets) * np.blackman(num_taps)
+    return (taps / taps.sum()).astype(np.float32)
+
+def postprocess_audio(pcm: bytes, mime_type: str) -> tuple[bytes, str]:
+    """Normalize loudness, trim silence and resample one segment of 16-bit PCM
+    
+    The segment is analysed in fixed blocks of AUDIO_BLOCK_MS: blocks below AUDIO_SILENCE_DBFS
+    count as silence, which is trimmed at both ends and shortened to AUDIO_MAX_SILENCE_MS between
+    turns. The remaining blocks are brought to AUDIO_TARGET_DBFS RMS without clipping. Returns the
+    processed PCM and its MIME type, which carries the output sample rate.
+    """
+    parameters = parse_audio_mime_type(mime_type)
+    if parameters["bits_per_sample"] != 16 or len(pcm) < 2:
+        return pcm, mime_type
+    rate = parameters["rate"]
+    samples = np.frombuffer(pcm, dtype="<i2", count=len(pcm) // 2).astype(np.float32) / 32768.0
+    
+    # Mean power of each block, zero padding the last partial block
+    block_size = max(1, rate * AUDIO_BLOCK_MS // 1000)
+    num_blocks = -(-len(samples) // block_size)
+    blocks = np.zeros(num_blocks * block_size, dtype=np.float32)
+    blocks[:len(samples)] = samples
+    blocks = blocks.reshape(num_blocks, block_size)
+    block_power = np.einsum("ij,ij->i", blocks, blocks) / block_size
+    voiced = block_power > 10 ** (AUDIO_SILENCE_DBFS / 10)
+    
+    keep = np.ones(num_blocks, dtype=bool)
+    gain = 1.0
+    if voiced.any():
+        first, last = np.flatnonzero(voiced)[[0, -1]]
+        keep[:first] = False
+        keep[last + 1:] = False
+        
+        # Keep only the first blocks of each silent run between voiced blocks
+        silent = ~voiced[first:last + 1]
+        if silent.any():
+            run_starts = silent & ~np.concatenate(([False], silent[:-1]))
+            start_positions = np.flatnonzero(run_starts)
+            run_index = np.maximum(np.cumsum(run_starts) - 1, 0)
+            position_in_run = np.arange(len(silent)) - start_positions[run_index]
+            max_silent_blocks = max(1, AUDIO_MAX_SILENCE_MS // AUDIO_BLOCK_MS)
+            keep[first:last + 1] = ~silent | (position_in_run < max_silent_blocks)
+        
+        # Gate the loudness measurement to speech so pauses do not inflate the gain
+        rms_db = 10 * np.log10(np.mean(block_power[voiced]))
+        gain = 10 ** (min(AUDIO_TARGET_DBFS - rms_db, AUDIO_MAX_GAIN_DB) / 20)
+    
+    samples = samples[np.repeat(keep, block_size)[:len(samples)]]
+    
+    output_rate = AUDIO_OUTPUT_SAMPLE_RATE or rate
+    if output_rate != rate and len(samples):
+        if output_rate < rate:
+            # Remove what the output rate cannot represent, or it folds back as audible aliasing
+            samples = np.convolve(samples, lowpass_filter(0.45 * output_rate / rate), mode="same")
+        # Linear interpolation onto the output sample grid
+        num_output = max(1, round(len(samples) * output_rate / rate))
+        positions = np.arange(num_output, dtype=np.float64) * (rate / output_rate)
+        samples = np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+    
+    peak = np.max(np.abs(samples)) if len(samples) else 0.0
+    if peak * gain > 0.99:
+        gain = 0.99 / peak
+    samples *= gain
+    
+    output = np.clip(np.rint(samples * 32768.0), -32768, 32767).astype("<i2")
+    return output.tobytes(), f"audio/L16;rate={output_rate}"
+
+async def write_conversation_script(
+    client: genai.Client,
+    pdf_text: str,
+    speaker1_config: SpeakerConfig,
+    speaker2_config: SpeakerConfig,
+    tone: str,
+    job: Optional[Job] = None,
+    long_document: bool = False
+) -> str:
+    """Condense long documents if requested and write the script for a tone"""
+    
+    # Step 0: Condense long documents into a digest that covers every section
+    text_budget = PROMPT_TEXT_CHARS
+    if long_document:
+        if job:
+            job.set_stage("summarizing", 0.1)
+        source_text = pdf_text
+        if job and job.shared:
+            pdf_text = await job.shared.run(
+                ("digest", job.pdf_hash), lambda: generate_document_digest(client, source_text)
+            )
+        else:
+            pdf_text = await generate_document_digest(client, source_text)
+        text_budget = LONG_DOCUMENT_DIGEST_CHARS
+    
+    # Step 1: Generate script based on mode
+    if job:
+        job.set_stage("scripting", 0.15)
+    speaker_labels = (speaker1_config.name, speaker2_config.name)
+    
+    async def write_script() -> tuple[str, tuple[str, str]]:
+        with stage_timer("selection", tone=tone, characters=len(pdf_text)):
+            prompt_text = await asyncio.to_thread(select_passages, pdf_text, text_budget)
+        with stage_timer("script", tone=tone, job_id=job.id if job else None):
+            return await generate_script(
+                client, prompt_text, speaker1_config, speaker2_config, tone, text_budget
+            ), speaker_labels
+    
+    if job and job.shared:
+        # Variants of a batch share one script per tone, relabelled with their own speaker names
+        conversation_script, script_labels = await job.shared.run(
+            ("script", job.pdf_hash, tone, long_document), write_script
+        )
+        conversation_script = relabel_script(conversation_script, script_labels, speaker_labels)
+    else:
+        conversation_script, _ = await write_script()
+    return conversation_script
+
 async def generate_conversational_audio(
+    client: genai.Client,
     pdf_text: str, 
     speaker1_config: SpeakerConfig, 
     speaker2_config: SpeakerConfig, 
-    tone: str
+    tone: str,
+    job: Optional[Job] = None,
+    long_document: bool = False
 ) -> str:
     """Generate NotebookLM-style conversational audio using Gemini 2.5 native TTS"""
     
-    client = genai.Client(api_key=os.environ.get("GEMINI_API_KEY"))
-    
-    # Step 1: Generate script based on mode
-    if tone == "recursive":
-        conversation_script = await generate_recursive_explanation_script(
-            client, pdf_text, speaker1_config
-        )
-    elif tone == "single_speaker":
-        conversation_script = await generate_single_speaker_script(
-            client, pdf_text, speaker1_config, tone
-        )
+    # Step 0 and 1: Write the script, unless the job is re-synthesizing an edited one
+    if job and job.script is not None:
+        conversation_script = job.script
     else:
-        conversation_script = await generate_conversation_script(
-            client, pdf_text, speaker1_config, speaker2_config, tone
+        conversation_script = await write_conversation_script(
+            client, pdf_text, speaker1_config, speaker2_config, tone, job, long_document
         )
     
     # Step 2: Convert script to audio using Gemini 2.5 TTS  
+    if job:
+        job.set_stage("synthesizing", 0.4)
     is_single_speaker = tone in ["recursive", "single_speaker"]
     
     if is_single_speaker:
         logger.info("Converting script to single-speaker audio...")
         if tone == "recursive":
-            prompt_text = f"Read this explanation script aloud as a single narrator:\n\n{conversation_script}"
+            prompt_prefix = "Read this explanation script aloud as a single narrator:\n\n"
         else:
-            prompt_text = f"Read this professional script aloud as a single narrator:\n\n{conversation_script}"
+            prompt_prefix = "Read this professional script aloud as a single narrator:\n\n"
+        speaker_names = [speaker1_config.name]
     else:
         logger.info("Converting script to multi-speaker audio...")
-        prompt_text = f"Read this conversational script aloud with the specified speakers:\n\n{conversation_script}"
+        prompt_prefix = "Read this conversational script aloud with the specified speakers:\n\n"
+        speaker_names = [speaker1_config.name, speaker2_config.name]
     
     tts_start_time = time.time()
     
-    model = "gemini-2.5-pro-preview-tts"
-    contents = [
-        types.Content(
-            role="user",
-            parts=[
-                types.Part.from_text(text=prompt_text),
-            ],
-        ),
-    ]
-    
     # Configure TTS based on speaker mode
     if is_single_speaker:
         # Single speaker configuration
@@ -486,9 +3429,9 @@ async def generate_conversational_audio(
             temperature=0.8,
             response_modalities=["audio"],
             speech_config=types.SpeechConfig(
-                multiSpeakerVoiceConfig=MultiSpeakerVoiceConfig(
+                multiSpeakerVoiceConfig=types.MultiSpeakerVoiceConfig(
                     speakerVoiceConfigs=[
-                        SpeakerVoiceConfig(
+                        types.SpeakerVoiceConfig(
                             speaker=speaker1_config.name,
                             voiceConfig=types.VoiceConfig(
                                 prebuiltVoiceConfig=types.PrebuiltVoiceConfig(
@@ -496,7 +3439,7 @@ async def generate_conversational_audio(
                                 )
                             ),
                         ),
-                        SpeakerVoiceConfig(
+                        types.SpeakerVoiceConfig(
                             speaker=speaker2_config.name,
                             voiceConfig=types.VoiceConfig(
                                 prebuiltVoiceConfig=types.PrebuiltVoiceConfig(
@@ -509,70 +3452,141 @@ async def generate_conversational_audio(
             ),
         )
     
-    # Generate and save audio
-    temp_dir = tempfile.gettempdir()
-    output_filename = f"notebooklm_audio_{uuid.uuid4()}.wav"
-    output_path = os.path.join(temp_dir, output_filename)
+    # Split the script into segments that are synthesized concurrently and stitched in order
+    turns = parse_script_turns(conversation_script, speaker_names)
+    if job and job.previous_segments:
+        # Keep the segments an edit left untouched so their audio comes from the segment cache
+        segments = plan_edited_segments(
+            job.previous_segments, turns, TTS_SEGMENT_CHARS, TTS_FIRST_SEGMENT_CHARS
+        )
+    else:
+        segments = group_turns_into_segments(turns, TTS_SEGMENT_CHARS, TTS_FIRST_SEGMENT_CHARS)
+    if job:
+        job.script = format_script_turns(turns)
+        job.segments = segments
+    logger.info(f"Synthesizing {len(turns)} turns in {len(segments)} segments")
+    voices = {
+        speaker.name: speaker.voice
+        for speaker in (speaker1_config, speaker2_config) if speaker.name in speaker_names
+    }
+    
+    # Generate and save audio, appending PCM to the file as it arrives
+    output_path = artifact_store.new_path(".wav")
     
-    file_index = 0
-    audio_chunks = []
+    writer = WavWriter(output_path)
+    if job:
+        job.result_path = output_path
     
-    for chunk in client.models.generate_content_stream(
-        model=model,
-        contents=contents,
-        config=generate_content_config,
-    ):
-        if (
-            chunk.candidates is None
-            or chunk.candidates[0].content is None
-            or chunk.candidates[0].content.parts is None
-        ):
-            continue
-            
-        if (chunk.candidates[0].content.parts[0].inline_data and 
-            chunk.candidates[0].content.parts[0].inline_data.data):
-            
-            inline_data = chunk.candidates[0].content.parts[0].inline_data
-            data_buffer = inline_data.data
+    # Encode compressed output alongside synthesis so it is ready when the last segment lands
+    encoder = None
+    if job and job.output_format != "wav":
+        _, extension, _, _ = OUTPUT_FORMATS[job.output_format]
+        encoder = AudioEncoder(job.output_format, os.path.splitext(output_path)[0] + extension)
+    
+    async def emit(pcm: bytes, mime_type: str):
+        writer.write(pcm, mime_type)
+        if encoder:
+            await encoder.write(pcm, mime_type)
+    
+    async def synthesize(index: int) -> tuple[bytes, str]:
+        segment_text = format_script_turns(segments[index])
+        pcm, mime_type = await synthesize_segment_cached(
+            client, prompt_prefix + segment_text, generate_content_config, index,
+            segment_cache_key(segments[index], voices, tone), read_cache=not (job and job.bypass_cache)
+        )
+        if AUDIO_POSTPROCESSING:
+            # Raw audio is what the segment cache keeps, so settings can change without resynthesis
+            with stage_timer("postprocess", tone=tone, segment=index):
+                pcm, mime_type = await asyncio.to_thread(postprocess_audio, pcm, mime_type)
+        return pcm, mime_type
+    
+    def start_segment(index: int) -> asyncio.Task:
+        return asyncio.create_task(synthesize(index))
+    
+    # Keep a bounded window of segments in flight ahead of the one being written
+    pending = {}
+    try:
+        for index in range(len(segments)):
+            for ahead in range(index, min(index + TTS_SEGMENT_CONCURRENCY, len(segments))):
+                if ahead not in pending:
+                    pending[ahead] = start_segment(ahead)
             
-            # Convert to WAV if needed
-            if inline_data.mime_type != "audio/wav":
-                data_buffer = convert_to_wav(inline_data.data, inline_data.mime_type)
+            pcm, mime_type = await pending.pop(index)
+            if index > 0:
+                await emit(silence_pcm(mime_type, TTS_SEGMENT_PADDING_MS), mime_type)
+            await emit(pcm, mime_type)
             
-            audio_chunks.append(data_buffer)
-        else:
-            # Print any text responses for debugging
-            if hasattr(chunk, 'text') and chunk.text:
-                print(f"Generated text: {chunk.text}")
-    
-    # Combine all audio chunks
-    if audio_chunks:
-        combined_audio = b''.join(audio_chunks)
-        with open(output_path, 'wb') as f:
-            f.write(combined_audio)
-        
-        tts_time = time.time() - tts_start_time
-        audio_size = len(combined_audio) / 1024 / 1024  # MB
-        logger.info(f"TTS completed in {tts_time:.1f}s, generated {audio_size:.1f}MB audio")
-        logger.info(f"Audio saved to: {output_path}")
-        
-        return output_path
-    else:
+            if job:
+                job.publish_audio(writer.data_size - job.audio_bytes, mime_type)
+                job.progress = max(job.progress, 0.4 + 0.55 * (index + 1) / len(segments))
+        if encoder:
+            await encoder.close()
+    except BaseException:
+        for task in pending.values():
+            task.cancel()
+        writer.abort()
+        if encoder:
+            await encoder.abort()
+        raise
+    finally:
+        artifact_store.unpin(output_path)
+    
+    if writer.data_size == 0:
+        writer.abort()
         logger.error("No audio chunks generated")
         raise HTTPException(status_code=500, detail="No audio generated")
+    
+    writer.close()
+    if encoder:
+        job.encoded_paths[job.output_format] = encoder.output_path
+    tts_time = time.time() - tts_start_time
+    metrics.observe("notebooklm_stage_duration_seconds", tts_time, stage="synthesis", tone=tone)
+    audio_size = writer.data_size / 1024 / 1024  # MB
+    logger.info(f"TTS completed in {tts_time:.1f}s, generated {audio_size:.1f}MB audio")
+    logger.info(f"Audio saved to: {output_path}")
+    
+    return output_path
+
+async def generate_script(
+    client: genai.Client,
+    pdf_text: str,
+    speaker1_config: SpeakerConfig,
+    speaker2_config: SpeakerConfig,
+    tone: str,
+    text_budget: int = PROMPT_TEXT_CHARS
+) -> str:
+    """Generate the script for a tone with the matching single or multi-speaker generator"""
+    if tone == "recursive":
+        return await generate_recursive_explanation_script(
+            client, pdf_text, speaker1_config, text_budget
+        )
+    elif tone == "single_speaker":
+        return await generate_single_speaker_script(
+            client, pdf_text, speaker1_config, tone, text_budget
+        )
+    return await generate_conversation_script(
+        client, pdf_text, speaker1_config, speaker2_config, tone, text_budget
+    )
+
+def relabel_script(script: str, old_names: tuple[str, ...], new_names: tuple[str, ...]) -> str:
+    """Swap speaker names in a script, both as turn labels and where speakers address each other"""
+    mapping = {old: new for old, new in zip(old_names, new_names) if old != new}
+    if not mapping:
+        return script
+    pattern = re.compile(r"\b(" + "|".join(re.escape(name) for name in mapping) + r")\b")
+    return pattern.sub(lambda match: mapping[match.group(1)], script)
 
 def create_conversation_prompt(
     pdf_text: str, 
     speaker1_config: SpeakerConfig, 
     speaker2_config: SpeakerConfig, 
-    tone: str
+    tone: str,
+    text_budget: int = PROMPT_TEXT_CHARS
 ) -> str:
     """Create a prompt for NotebookLM-style conversation"""
     
-    # Truncate text to fit within context limits
-    max_text_length = 4000
-    if len(pdf_text) > max_text_length:
-        pdf_text = pdf_text[:max_text_length] + "..."
+    # Keep the most informative passages that fit within context limits
+    pdf_text = select_passages(pdf_text, text_budget)
     
     # Get tone-specific instruction
     tone_instruction = TONE_PRESETS.get(tone, TONE_PRESETS["conversational"])["prompt_addition"]
@@ -596,19 +3610,194 @@ Start the conversation:"""
     
     return prompt
 
-def convert_to_wav(audio_data: bytes, mime_type: str) -> bytes:
-    """Convert audio data to WAV format"""
-    parameters = parse_audio_mime_type(mime_type)
-    bits_per_sample = parameters["bits_per_sample"]
-    sample_rate = parameters["rate"]
+WAV_HEADER_SIZE = 44
+
+class WavWriter:
+    """Write a single WAV header and append PCM chunks straight to disk, patching sizes on close"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, "wb")
+        self.sample_rate: Optional[int] = None
+        self.bits_per_sample: Optional[int] = None
+        self.data_size = 0
+
+    def write(self, pcm: bytes, mime_type: str) -> int:
+        parameters = parse_audio_mime_type(mime_type)
+        if self.sample_rate is None:
+            self.sample_rate = parameters["rate"]
+            self.bits_per_sample = parameters["bits_per_sample"]
+            # Sizes are unknown until close, so start with a streaming header
+            self.file.write(wav_header(self.sample_rate, self.bits_per_sample, None))
+        elif (parameters["rate"], parameters["bits_per_sample"]) != (self.sample_rate, self.bits_per_sample):
+            raise ValueError(
+                f"Audio format changed mid-stream from {self.bits_per_sample}-bit {self.sample_rate} Hz "
+                f"to {parameters['bits_per_sample']}-bit {parameters['rate']} Hz"
+            )
+        
+        self.file.write(pcm)
+        # Flush so streaming readers tailing the file see the chunk
+        self.file.flush()
+        self.data_size += len(pcm)
+        return len(pcm)
+
+    def close(self):
+        if self.sample_rate is not None:
+            # RIFF chunks are word aligned, the pad byte is not part of the data size
+            if self.data_size % 2:
+                self.file.write(b"\x00")
+            self.file.seek(0)
+            self.file.write(wav_header(self.sample_rate, self.bits_per_sample, self.data_size))
+        self.file.close()
+
+    def abort(self):
+        """Close and delete a partially written file"""
+        self.file.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+def decode_audio_chunk(audio_data: bytes, mime_type: str) -> tuple[bytes, str]:
+    """Return the raw PCM and its L16 MIME type, unwrapping chunks that arrive as WAV"""
+    if mime_type != "audio/wav":
+        return audio_data, mime_type
+    with wave.open(io.BytesIO(audio_data)) as wav_file:
+        pcm = wav_file.readframes(wav_file.getnframes())
+        return pcm, f"audio/L{wav_file.getsampwidth() * 8};rate={wav_file.getframerate()}"
+
+# format -> (media type, file extension, ffmpeg codec arguments, ffmpeg container)
+OUTPUT_FORMATS = {
+    "wav": ("audio/wav", ".wav", None, None),
+    "flac": ("audio/flac", ".flac", ["-c:a", "flac"], "flac"),
+    "opus": ("audio/ogg", ".opus", ["-c:a", "libopus", "-b:a", OPUS_BITRATE, "-application", "voip"], "ogg"),
+}
+
+OUTPUT_FORMAT_MEDIA_TYPES = {
+    "audio/wav": "wav", "audio/x-wav": "wav", "audio/wave": "wav",
+    "audio/flac": "flac", "audio/x-flac": "flac",
+    "audio/ogg": "opus", "audio/opus": "opus",
+}
+
+def negotiate_output_format(requested: Optional[str], accept: Optional[str], default: str = "wav") -> str:
+    """Pick the output format from an explicit request, falling back to the Accept header"""
+    if requested:
+        output_format = requested.strip().lower()
+        if output_format not in OUTPUT_FORMATS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unsupported output format {requested!r}, choose one of {', '.join(OUTPUT_FORMATS)}"
+            )
+    else:
+        output_format = default
+        media_ranges = []
+        for position, media_range in enumerate((accept or "").split(",")):
+            media_type, _, params = media_range.partition(";")
+            quality = 1.0
+            for param in params.split(";"):
+                key, _, value = param.strip().partition("=")
+                if key == "q":
+                    try:
+                        quality = float(value)
+                    except ValueError:
+                        pass
+            media_ranges.append((-quality, position, media_type.strip().lower()))
+        for negative_quality, _, media_type in sorted(media_ranges):
+            if negative_quality < 0 and media_type in OUTPUT_FORMAT_MEDIA_TYPES:
+                output_format = OUTPUT_FORMAT_MEDIA_TYPES[media_type]
+                break
+    
+    if output_format != "wav" and shutil.which(FFMPEG_BINARY) is None:
+        raise HTTPException(status_code=406, detail=f"{output_format} output is not available on this server")
+    return output_format
+
+class AudioEncoder:
+    """Encode PCM with an ffmpeg subprocess that is fed chunk by chunk as audio arrives
+    
+    Without an output path the encoded stream is available on `process.stdout`.
+    """
+
+    def __init__(self, output_format: str, output_path: Optional[str] = None):
+        self.output_format = output_format
+        self.output_path = output_path
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.mime_type: Optional[str] = None
+
+    async def start(self, mime_type: str):
+        parameters = parse_audio_mime_type(mime_type)
+        bits = parameters["bits_per_sample"]
+        sample_format = "u8" if bits == 8 else f"s{bits}le"
+        _, _, codec_args, container = OUTPUT_FORMATS[self.output_format]
+        self.mime_type = mime_type
+        self.process = await asyncio.create_subprocess_exec(
+            FFMPEG_BINARY, "-hide_banner", "-loglevel", "error", "-y",
+            "-f", sample_format, "-ar", str(parameters["rate"]), "-ac", "1", "-i", "pipe:0",
+            *codec_args, "-f", container, self.output_path or "pipe:1",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.DEVNULL if self.output_path else asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+
+    async def write(self, pcm: bytes, mime_type: str):
+        if self.process is None:
+            await self.start(mime_type)
+        elif parse_audio_mime_type(mime_type) != parse_audio_mime_type(self.mime_type):
+            raise ValueError("Audio format changed mid-stream")
+        self.process.stdin.write(pcm)
+        await self.process.stdin.drain()
+
+    def close_input(self):
+        if self.process is not None and not self.process.stdin.is_closing():
+            self.process.stdin.close()
+
+    async def close(self):
+        """Finish encoding and wait for ffmpeg to exit"""
+        if self.process is None:
+            return
+        self.close_input()
+        stderr = await self.process.stderr.read()
+        if await self.process.wait() != 0:
+            raise RuntimeError(f"ffmpeg {self.output_format} encoding failed: {stderr.decode(errors='replace')[:200]}")
+
+    async def abort(self):
+        """Stop the encoder and delete partial output"""
+        if self.process is not None and self.process.returncode is None:
+            self.process.kill()
+            await self.process.wait()
+        if self.output_path:
+            remove_file(self.output_path)
+
+async def encode_audio_file(wav_path: str, output_format: str) -> str:
+    """Encode a finished WAV file to another format next to it"""
+    _, extension, _, _ = OUTPUT_FORMATS[output_format]
+    output_path = os.path.splitext(wav_path)[0] + extension
+    encoder = AudioEncoder(output_format, output_path)
+    try:
+        with stage_timer("encoding", format=output_format), open(wav_path, "rb") as f:
+            f.seek(WAV_HEADER_SIZE)
+            with wave.open(wav_path) as wav_file:
+                mime_type = f"audio/L{wav_file.getsampwidth() * 8};rate={wav_file.getframerate()}"
+            while True:
+                data = f.read(256 * 1024)
+                if not data:
+                    break
+                await encoder.write(data, mime_type)
+            await encoder.close()
+    except BaseException:
+        await encoder.abort()
+        raise
+    metrics.inc("notebooklm_audio_bytes_total", os.path.getsize(output_path), format=output_format)
+    return output_path
+
+def wav_header(sample_rate: int, bits_per_sample: int, data_size: Optional[int]) -> bytes:
+    """Build a PCM WAV header, using the maximum size when the length is unknown (streaming)"""
     num_channels = 1
-    data_size = len(audio_data)
     bytes_per_sample = bits_per_sample // 8
     block_align = num_channels * bytes_per_sample
     byte_rate = sample_rate * block_align
+    if data_size is None:
+        data_size = 0xFFFFFFFF - 36
     chunk_size = 36 + data_size
 
-    header = struct.pack(
+    return struct.pack(
         "<4sI4s4sIHHIIHH4sI",
         b"RIFF",          # ChunkID
         chunk_size,       # ChunkSize
@@ -624,7 +3813,6 @@ def convert_to_wav(audio_data: bytes, mime_type: str) -> bytes:
         b"data",          # Subchunk2ID
         data_size         # Subchunk2Size
     )
-    return header + audio_data
 
 def parse_audio_mime_type(mime_type: str) -> dict[str, int]:
     """Parse audio parameters from MIME type"""
@@ -648,12 +3836,6 @@ def parse_audio_mime_type(mime_type: str) -> dict[str, int]:
 
     return {"bits_per_sample": bits_per_sample, "rate": rate}
 
-def cleanup_file(file_path: str):
-    def cleanup():
-        if os.path.exists(file_path):
-            os.remove(file_path)
-    return cleanup
-
 @app.get("/")
 async def root():
     return {
@@ -669,6 +3851,33 @@ async def root():
         ]
     }
 
+@app.get("/ready")
+async def get_readiness(request: Request):
+    """Readiness probe, unlike the / liveness probe it fails until the workers can convert"""
+    ready = getattr(request.app.state, "ready", None)
+    is_ready = ready is not None and ready.is_set()
+    return JSONResponse(status_code=200 if is_ready else 503, content={
+        "ready": is_ready,
+        "gemini_configured": getattr(request.app.state, "gemini_client", None) is not None,
+        "workers": len(job_manager.workers),
+        "queued_jobs": job_manager.queue.qsize(),
+    })
+
+@app.get("/cache")
+async def get_cache_stats():
+    """Get result cache hit/miss counters and usage"""
+    return result_cache.stats()
+
+@app.get("/metrics")
+async def get_metrics():
+    """Pipeline metrics in the Prometheus text exposition format"""
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/artifacts")
+async def get_artifact_stats():
+    """Get artifact store usage and cleanup counters"""
+    return artifact_store.stats()
+
 @app.get("/voices")
 async def get_available_voices():
     """Get list of available voice options"""
@@ -0,0 +1,123 @@
+"""Fixtures running the app in-process against the benchmark's fake Gemini backend
+
+The app, its worker pool and every test share one event loop, like they would under uvicorn.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+from typing import Callable
+
+import httpx
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Configure the app before it is imported, keeping its files out of the real cache and artifact store
+SCRATCH = tempfile.mkdtemp(prefix="notebooklm_tests_")
+os.environ.update({
+    "RESULT_CACHE_DIR": os.path.join(SCRATCH, "cache"),
+    "ARTIFACT_DIR": os.path.join(SCRATCH, "artifacts"),
+    "SEGMENT_CACHE_DIR": os.path.join(SCRATCH, "segments"),
+    "STATE_DB_PATH": os.path.join(SCRATCH, "state.sqlite3"),
+    "JOB_WORKERS": "4",
+    "TTS_CONCURRENCY": "16",
+    "STATE_POLL_SECONDS": "0.05",
+    "GEMINI_RETRY_BASE_SECONDS": "0.05",
+    "GEMINI_RETRY_MAX_SECONDS": "0.5",
+})
+
+import benchmark  # noqa: E402
+import main  # noqa: E402
+
+SPEAKERS = {"speaker1_name": benchmark.SPEAKER1, "speaker2_name": benchmark.SPEAKER2}
+
+def fake_args(**overrides) -> argparse.Namespace:
+    """Settings for benchmark.FakeGemini, fast enough for tests"""
+    settings = {
+        "latency": 0.05,
+        "tts_first_chunk": 0.05,
+        "tts_chunk_interval": 0.01,
+        "tts_chunks": 3,
+        "chunk_bytes": 9600,
+        "script_turns": 12,
+        "error_rate": 0.0,
+    }
+    settings.update(overrides)
+    return argparse.Namespace(**settings)
+
+def make_pdf(seed: int, pages: int = 1) -> bytes:
+    """A small PDF whose content, and so its cache key, is unique to the seed"""
+    return benchmark.make_pdf(pages, 200, seed=seed)
+
+async def submit(http: httpx.AsyncClient, pdf: bytes, **data) -> dict:
+    """Queue a conversion through POST /jobs and return the job status"""
+    response = await http.post(
+        "/jobs", files={"file": ("test.pdf", pdf, "application/pdf")}, data={**SPEAKERS, **data}
+    )
+    assert response.status_code == 202, response.text
+    return response.json()
+
+async def finished(job_id: str, timeout: float = 30) -> main.Job:
+    job = await main.job_manager.get(job_id)
+    await asyncio.wait_for(job.done.wait(), timeout)
+    return job
+
+def track_script_calls(fake: benchmark.FakeGemini) -> dict:
+    """Count the fake's text generation calls as they start, complete or get cancelled"""
+    calls = {"started": 0, "completed": 0, "cancelled": 0}
+    generate = fake.aio.models.generate_content
+
+    async def tracked(*args, **kwargs):
+        calls["started"] += 1
+        try:
+            response = await generate(*args, **kwargs)
+        except asyncio.CancelledError:
+            calls["cancelled"] += 1
+            raise
+        calls["completed"] += 1
+        return response
+    fake.aio.models.generate_content = tracked
+    return calls
+
+async def wait_for(condition: Callable[[], bool], timeout: float = 10):
+    async def poll():
+        while not condition():
+            await asyncio.sleep(0.01)
+    await asyncio.wait_for(poll(), timeout)
+
+@pytest.fixture(scope="session")
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+@pytest.fixture(scope="session")
+def app(loop):
+    lifespan = main.app.router.lifespan_context(main.app)
+    main.app.state.gemini_client = benchmark.FakeGemini(fake_args())
+    loop.run_until_complete(lifespan.__aenter__())
+    loop.run_until_complete(main.app.state.ready.wait())
+    yield main.app
+    loop.run_until_complete(lifespan.__aexit__(None, None, None))
+
+@pytest.fixture
+def fake(app) -> benchmark.FakeGemini:
+    """A fresh fake Gemini backend serving the app, counting the calls of one test"""
+    client = benchmark.FakeGemini(fake_args())
+    app.state.gemini_client = main.job_manager.client = client
+    return client
+
+@pytest.fixture
+def run(loop, app):
+    """Run a test coroutine on the app's event loop, handing it an HTTP client for the app"""
+    def run(test):
+        async def with_client():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=60) as http:
+                return await test(http)
+        return loop.run_until_complete(with_client())
+    return run
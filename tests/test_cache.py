@@ -0,0 +1,72 @@
+import asyncio
+import shutil
+import time
+
+import main
+from conftest import finished, make_pdf, submit
+
+def test_cache_key_matches_the_voices_used():
+    speaker1, _ = main.generate_speaker_configs(" Sam ", "Puck", None, None)
+    assert (speaker1.name, speaker1.voice) == ("Sam", "puck")
+    key = main.result_cache_key("pdf", "Sam", "puck", None, None, "conversational")
+    assert main.result_cache_key("pdf", " Sam ", "Puck", None, None, "conversational") == key
+    # An unknown voice falls back to the default in both
+    assert main.generate_speaker_configs(None, "nope", None, None)[0].voice == "zephyr"
+    assert main.result_cache_key("pdf", "Sam", "nope", None, None, "conversational") == (
+        main.result_cache_key("pdf", "Sam", "zephyr", None, None, "conversational")
+    )
+
+def test_repeated_conversion_is_served_from_the_cache(run, fake):
+    async def test(http):
+        pdf = make_pdf(300)
+        first = await finished((await submit(http, pdf, speaker1_voice="puck"))["job_id"])
+        calls = fake.calls
+        second = await finished((await submit(http, pdf, speaker1_voice="Puck"))["job_id"])
+        assert fake.calls == calls
+        return first, second
+
+    first, second = run(test)
+    assert (first.status, first.cache_hit) == ("completed", False)
+    assert (second.status, second.cache_hit) == ("completed", True)
+    assert second.speaker1 == first.speaker1 and second.speaker1.voice == "puck"
+    assert second.script == first.script and second.segments == first.segments
+    assert second.result_path != first.result_path
+
+def test_cache_hit_keeps_the_default_speaker_names_of_the_episode(run, fake):
+    async def test(http):
+        pdf = make_pdf(301)
+        data = {"speaker1_name": "", "speaker2_name": ""}
+        first = await finished((await submit(http, pdf, **data))["job_id"])
+        second = await finished((await submit(http, pdf, **data))["job_id"])
+        return first, second
+
+    first, second = run(test)
+    assert second.cache_hit
+    assert [second.speaker1.name, second.speaker2.name] == [first.speaker1.name, first.speaker2.name]
+
+def test_cache_hit_copies_the_episode_off_the_event_loop(run, fake, monkeypatch):
+    copyfile = shutil.copyfile
+
+    def slow_copyfile(source, destination):
+        time.sleep(0.5)
+        return copyfile(source, destination)
+
+    async def test(http):
+        pdf = make_pdf(302)
+        await finished((await submit(http, pdf))["job_id"])
+        monkeypatch.setattr(main.shutil, "copyfile", slow_copyfile)
+        hit = asyncio.ensure_future(submit(http, pdf))
+        # The longest the event loop went without running this task while the hit was served
+        stall = 0.0
+        last = time.perf_counter()
+        while not hit.done():
+            await asyncio.sleep(0.01)
+            now = time.perf_counter()
+            stall = max(stall, now - last)
+            last = now
+        job = await finished((await hit)["job_id"])
+        return stall, job
+
+    stall, job = run(test)
+    assert job.cache_hit and job.status == "completed"
+    assert stall < 0.25
@@ -0,0 +1,102 @@
+import asyncio
+import gc
+import json
+
+import httpx
+
+import main
+from conftest import SPEAKERS, fake_args, finished, make_pdf, submit, track_script_calls, wait_for
+
+def test_delete_cancels_the_gemini_call_of_a_running_job(run, fake):
+    fake.args = fake_args(latency=1.0)
+    calls = track_script_calls(fake)
+
+    async def test(http):
+        job_id = (await submit(http, make_pdf(400)))["job_id"]
+        await wait_for(lambda: calls["started"])
+        response = await http.delete(f"/jobs/{job_id}")
+        assert response.status_code == 200
+        return await finished(job_id)
+
+    job = run(test)
+    assert job.status == "cancelled"
+    assert calls == {"started": 1, "completed": 0, "cancelled": 1}
+
+def test_shared_batch_script_is_cancelled_with_the_last_job(run, fake):
+    fake.args = fake_args(latency=1.0)
+    calls = track_script_calls(fake)
+    variants = [{**SPEAKERS, "speaker1_voice": voice} for voice in ("zephyr", "alnilam")]
+
+    async def test(http):
+        response = await http.post(
+            "/batch",
+            files=[("files", ("test.pdf", make_pdf(401), "application/pdf"))],
+            data={"variants": json.dumps(variants)},
+        )
+        assert response.status_code == 202, response.text
+        job_ids = [job["job_id"] for job in response.json()["jobs"]]
+        jobs = [main.job_manager.jobs[job_id] for job_id in job_ids]
+        await wait_for(lambda: calls["started"] and all(job.stage == "scripting" for job in jobs))
+
+        await http.delete(f"/jobs/{job_ids[0]}")
+        await asyncio.sleep(0.1)
+        # The other variant still waits for the script
+        assert calls["cancelled"] == 0
+        await http.delete(f"/jobs/{job_ids[1]}")
+        return [await finished(job_id) for job_id in job_ids]
+
+    jobs = run(test)
+    assert [job.status for job in jobs] == ["cancelled", "cancelled"]
+    assert calls == {"started": 1, "completed": 0, "cancelled": 1}
+
+async def post_and_disconnect(app, url: str, after: float, **kwargs) -> list:
+    """Send a request straight to the ASGI app and hang up after a delay, returning what it sent back"""
+    request = httpx.Request("POST", url, **kwargs)
+    messages = [{"type": "http.request", "body": request.read(), "more_body": False}]
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        await asyncio.sleep(after)
+        return {"type": "http.disconnect"}
+
+    sent = []
+    async def send(message):
+        sent.append(message)
+
+    await app({
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+        "scheme": "http", "path": request.url.path, "raw_path": request.url.raw_path,
+        "query_string": b"", "root_path": "", "client": ("127.0.0.1", 1), "server": ("test", 80),
+        "headers": [(name.lower(), value) for name, value in request.headers.raw],
+    }, receive, send)
+    return sent
+
+def test_disconnected_batch_archive_cancels_its_jobs_quietly(run, loop, app, fake):
+    fake.args = fake_args(latency=1.0)
+    variants = [{**SPEAKERS, "speaker1_voice": voice} for voice in ("zephyr", "alnilam")]
+    errors = []
+    loop.set_exception_handler(lambda _, context: errors.append(context))
+
+    async def test(http):
+        before = set(main.job_manager.jobs)
+        sent = await post_and_disconnect(
+            app, "http://test/batch", after=0.3,
+            files=[("files", ("test.pdf", make_pdf(402), "application/pdf"))],
+            data={"variants": json.dumps(variants), "archive": "true"},
+        )
+        jobs = [job for job_id, job in main.job_manager.jobs.items() if job_id not in before]
+        for job in jobs:
+            await asyncio.wait_for(job.done.wait(), 10)
+        await asyncio.sleep(0.1)
+        gc.collect()
+        return sent, jobs
+
+    try:
+        sent, jobs = run(test)
+    finally:
+        loop.set_exception_handler(None)
+    assert sent[0]["status"] == 499
+    assert len(jobs) == 2
+    assert all(job.status == "cancelled" and job.cancel_reason == "client disconnected" for job in jobs)
+    assert errors == []
@@ -0,0 +1,54 @@
+import main
+from conftest import fake_args, finished, make_pdf, submit, track_script_calls, wait_for
+
+def test_identical_requests_share_one_conversion(run, fake):
+    fake.args = fake_args(latency=0.3)
+    calls = track_script_calls(fake)
+
+    async def test(http):
+        pdf = make_pdf(600)
+        leader = await submit(http, pdf)
+        follower = await submit(http, pdf)
+        await wait_for(lambda: calls["started"])
+        in_flight = [line for line in main.metrics.render().splitlines() if line.startswith("notebooklm_jobs_in_flight ")]
+        return await finished(leader["job_id"]), await finished(follower["job_id"]), in_flight
+
+    leader, follower, in_flight = run(test)
+    assert follower.coalesced_with == leader.id
+    assert (leader.status, follower.status) == ("completed", "completed")
+    assert not follower.cache_hit and follower.result_path != leader.result_path
+    assert follower.script == leader.script
+    # One script was written, and the follower is not counted as a second conversion
+    assert calls["completed"] == 1
+    assert in_flight == ["notebooklm_jobs_in_flight 1"]
+
+def test_cancelled_leader_keeps_running_for_its_follower(run, fake):
+    fake.args = fake_args(latency=0.3)
+
+    async def test(http):
+        pdf = make_pdf(601)
+        leader = await submit(http, pdf)
+        follower = await submit(http, pdf)
+        response = await http.delete(f"/jobs/{leader['job_id']}")
+        assert response.status_code == 200
+        return await finished(leader["job_id"]), await finished(follower["job_id"])
+
+    leader, follower = run(test)
+    assert leader.status == "cancelled"
+    assert follower.status == "completed"
+
+def test_conversion_stops_when_every_request_has_left(run, fake):
+    fake.args = fake_args(latency=1.0)
+    calls = track_script_calls(fake)
+
+    async def test(http):
+        pdf = make_pdf(602)
+        jobs = [await submit(http, pdf) for _ in range(2)]
+        await wait_for(lambda: calls["started"])
+        for job in jobs:
+            await http.delete(f"/jobs/{job['job_id']}")
+        return [await finished(job["job_id"], timeout=0.5) for job in jobs]
+
+    jobs = run(test)
+    assert [job.status for job in jobs] == ["cancelled", "cancelled"]
+    assert calls == {"started": 1, "completed": 0, "cancelled": 1}
@@ -0,0 +1,48 @@
+import asyncio
+import time
+
+from conftest import SPEAKERS, fake_args, make_pdf
+
+def convert(http, seed: int):
+    return http.post(
+        "/pdf-to-notebooklm-audio",
+        files={"file": ("test.pdf", make_pdf(seed), "application/pdf")},
+        data={**SPEAKERS, "bypass_cache": "true"},
+    )
+
+def test_concurrent_requests_take_about_as_long_as_one(run, fake):
+    fake.args = fake_args(latency=0.5, tts_first_chunk=0.3)
+
+    async def test(http):
+        start = time.perf_counter()
+        response = await convert(http, seed=100)
+        single = time.perf_counter() - start
+        assert response.status_code == 200
+
+        start = time.perf_counter()
+        responses = await asyncio.gather(*(convert(http, seed=101 + n) for n in range(4)))
+        concurrent = time.perf_counter() - start
+        assert [response.status_code for response in responses] == [200] * 4
+        return single, concurrent
+
+    single, concurrent = run(test)
+    # Four sequential conversions would take 4x; the Gemini calls overlap instead
+    assert concurrent < 1.5 * single, f"4 concurrent requests took {concurrent:.2f}s, one took {single:.2f}s"
+
+def test_event_loop_stays_responsive_during_conversions(run, fake):
+    fake.args = fake_args(latency=0.5, tts_first_chunk=0.3)
+
+    async def test(http):
+        conversions = asyncio.gather(*(convert(http, seed=110 + n) for n in range(4)))
+        await asyncio.sleep(0.2)
+        worst = 0.0
+        while not conversions.done():
+            start = time.perf_counter()
+            response = await http.get("/voices")
+            worst = max(worst, time.perf_counter() - start)
+            assert response.status_code == 200
+            await asyncio.sleep(0.05)
+        await conversions
+        return worst
+
+    assert run(test) < 0.25
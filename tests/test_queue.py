@@ -0,0 +1,57 @@
+import pytest
+from starlette.requests import Request
+
+import main
+from conftest import finished, make_pdf, submit
+
+def make_job(client_id: str, number: int) -> main.Job:
+    speaker = main.SpeakerConfig(name="Alex", voice="zephyr")
+    return main.Job(
+        id=f"{client_id}-{number}", filename="test.pdf", pdf_path=None,
+        speaker1=speaker, speaker2=speaker, tone="conversational", client_id=client_id,
+    )
+
+def test_waiting_jobs_are_served_round_robin_across_clients(loop):
+    queue = main.FairQueue(10, 0)
+    for job in [make_job("busy", n) for n in range(3)] + [make_job("quiet", 0)]:
+        queue.put_nowait(job)
+    order = [loop.run_until_complete(queue.get()).id for _ in range(4)]
+    assert order == ["busy-0", "quiet-0", "busy-1", "busy-2"]
+
+def test_full_client_share_is_rejected_with_retry_after():
+    manager = main.JobManager(1, 10, 2)
+    for n in range(2):
+        manager.queue.put_nowait(make_job("busy", n))
+    manager.admit("quiet")
+    with pytest.raises(main.HTTPException) as rejected:
+        manager.admit("busy")
+    assert rejected.value.status_code == 503
+    assert int(rejected.value.headers["Retry-After"]) >= 1
+
+def test_cache_hits_are_accepted_while_the_queue_is_full(run, fake, monkeypatch):
+    async def test(http):
+        pdf = make_pdf(500)
+        await finished((await submit(http, pdf))["job_id"])
+        # A manager whose workers never start keeps its queue full
+        monkeypatch.setattr(main, "job_manager", main.JobManager(1, 1, 0))
+        await submit(http, make_pdf(501))
+        rejected = await http.post("/jobs", files={"file": ("test.pdf", make_pdf(502), "application/pdf")})
+        hit = await submit(http, pdf)
+        return rejected, hit
+
+    rejected, hit = run(test)
+    assert rejected.status_code == 503 and "retry-after" in rejected.headers
+    assert hit["status"] == "completed"
+
+def request_from(host: str, headers: dict) -> Request:
+    return Request({
+        "type": "http", "client": (host, 1234),
+        "headers": [(name.encode(), value.encode()) for name, value in headers.items()],
+    })
+
+def test_client_identity_headers_are_only_trusted_from_proxies(monkeypatch):
+    monkeypatch.setattr(main, "TRUSTED_PROXIES", [main.ipaddress.ip_network("10.0.0.0/8")])
+    assert main.client_identity(request_from("203.0.113.5", {"x-client-id": "spoofed"})) == "203.0.113.5"
+    assert main.client_identity(request_from("10.0.0.2", {"x-client-id": "alice"})) == "alice"
+    forwarded = {"x-forwarded-for": "198.51.100.1, 203.0.113.9, 10.0.0.3"}
+    assert main.client_identity(request_from("10.0.0.2", forwarded)) == "203.0.113.9"
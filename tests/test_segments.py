@@ -0,0 +1,51 @@
+import main
+from conftest import finished, make_pdf, submit
+
+def sentences(count: int, start: int = 0) -> str:
+    return " ".join(f"This is sentence {n} of the turn, long enough to matter." for n in range(start, start + count))
+
+TURNS = [("Alex", sentences(12))] + [
+    ("Jordan" if n % 2 else "Alex", sentences(2, start=n)) for n in range(1, 12)
+]
+
+def test_first_segment_is_short():
+    segments = main.group_turns_into_segments(TURNS, 1500, 300)
+    assert sum(len(speaker) + len(text) + 3 for speaker, text in segments[0]) <= 300
+    assert all(sum(len(speaker) + len(text) + 3 for speaker, text in segment) <= 1500 for segment in segments)
+    # Nothing is lost or reordered by the split
+    assert " ".join(text for segment in segments for _, text in segment) == " ".join(text for _, text in TURNS)
+
+def test_unchanged_script_reuses_every_segment():
+    segments = main.group_turns_into_segments(TURNS, 1500, 300)
+    assert len(segments) > 2
+    assert main.plan_edited_segments(segments, TURNS, 1500, 300) == segments
+
+def count_tts_calls(fake) -> list:
+    calls = []
+    stream = fake.aio.models.generate_content_stream
+    def counted(*args, **kwargs):
+        calls.append(1)
+        return stream(*args, **kwargs)
+    fake.aio.models.generate_content_stream = counted
+    return calls
+
+def test_one_line_edit_costs_no_more_tts_calls_than_the_original(run, fake):
+    calls = count_tts_calls(fake)
+
+    async def test(http):
+        # Other tests have cached the fake script's segments, make the original pay for its own
+        job = await finished((await submit(http, make_pdf(200), bypass_cache="true"))["job_id"])
+        assert job.status == "completed"
+        original = len(calls)
+
+        script = (await http.get(f"/jobs/{job.id}/script")).json()["script"]
+        lines = script.splitlines()
+        lines[6] = lines[6].replace("a few sentences", "a few different sentences")
+        response = await http.post(f"/jobs/{job.id}/script", json={"script": "\n".join(lines)})
+        assert response.status_code == 202
+        edited = await finished(response.json()["job_id"])
+        assert edited.status == "completed"
+        return original, len(calls) - original
+
+    original, edit = run(test)
+    assert 0 < edit <= original
@@ -0,0 +1,23 @@
+import pytest
+
+import main
+
+class IncompleteBackend(main.StateBackend):
+    def save_job(self, record: dict):
+        pass
+
+    def load_job(self, job_id: str):
+        return None
+
+def test_backend_missing_a_method_fails_when_created():
+    with pytest.raises(TypeError, match="abstract"):
+        IncompleteBackend()
+
+@pytest.mark.parametrize("name", ["memory", "sqlite"])
+def test_claims_are_exclusive_until_released(name, tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "STATE_DB_PATH", str(tmp_path / "state.sqlite3"))
+    backend = main.create_state_backend(name)
+    assert backend.claim("key", "first", 60) is None
+    assert backend.claim("key", "second", 60) == "first"
+    backend.release("key", "first")
+    assert backend.claim("key", "second", 60) is None